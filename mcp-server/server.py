@@ -12,16 +12,37 @@ Usage:
   python server.py --transport sse          # SSE transport (HTTP clients)
 
 Configure with env vars:
-  QTODO_BACKEND_URL   URL of the FastAPI backend (default: http://localhost:8000)
+  QTODO_BACKEND_URL      URL of the FastAPI backend (default: http://localhost:8000)
+  QTODO_BACKEND_RETRIES  Retries for 429/503 and connect failures (default: 2)
+  QTODO_MCP_METRICS_PATH Prometheus route on the SSE transport (default: /metrics;
+                         empty disables it)
 """
 
 import os
 import asyncio
+import contextvars
+import functools
+import logging
+import re
+import time
+import uuid
+from collections import Counter
 from typing import Optional
 from mcp.server.fastmcp import FastMCP
 import httpx
 
+# msgpack is optional: with it, list responses come over the wire as compact
+# binary instead of JSON. Without it, we ask for JSON like everybody else.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 BACKEND_URL = os.getenv("QTODO_BACKEND_URL", "http://localhost:8000")
+BACKEND_RETRIES = int(os.getenv("QTODO_BACKEND_RETRIES", "2"))
+METRICS_PATH = os.getenv("QTODO_MCP_METRICS_PATH", "/metrics")
+
+logger = logging.getLogger("qtodo-mcp")
 
 mcp = FastMCP(
     "qtodo-gptchain",
@@ -38,9 +59,204 @@ def _backend(path: str) -> str:
     return f"{BACKEND_URL}{path}"
 
 
+LIST_HEADERS = {
+    "Accept": "application/msgpack, application/json;q=0.9" if msgpack else "application/json",
+}
+
+
+def _decode(resp: httpx.Response):
+    """Decode a backend response that may be msgpack or JSON."""
+    if msgpack is not None and resp.headers.get("content-type", "").startswith("application/msgpack"):
+        return msgpack.unpackb(resp.content)
+    return resp.json()
+
+
+# ── Tracing and metrics ───────────────────────────────────────────────────────
+# When an agent session feels slow, the time went somewhere: this layer, the
+# HTTP hop, or the backend grinding through calendars and RPCs. Every tool and
+# resource call is a span with a trace id. The id travels to the backend as
+# X-Trace-Id, which tags its logs with it and answers with a Server-Timing
+# header, so the three can be told apart.
+
+TRACE_HEADER = "X-Trace-Id"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RETRY_STATUSES = {429, 503}
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_span_name: contextvars.ContextVar[str] = contextvars.ContextVar("span_name", default="-")
+
+
+class _Histogram:
+    """Cumulative-bucket latency histogram, Prometheus style."""
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_calls: Counter = Counter()              # (kind, name, outcome)
+_call_latency: dict = {}                 # (kind, name) -> _Histogram
+_backend_statuses: Counter = Counter()   # (name, status)
+_backend_retries: Counter = Counter()    # (name, reason)
+_backend_latency: dict = {}              # name -> _Histogram, per HTTP attempt
+_backend_server: dict = {}               # name -> _Histogram, from Server-Timing
+
+
+def _observe(table: dict, key, seconds: float) -> None:
+    hist = table.get(key)
+    if hist is None:
+        hist = table[key] = _Histogram()
+    hist.observe(seconds)
+
+
+def _traced(kind: str):
+    """Wrap a tool or resource in a span: trace id, timing, outcome counters.
+
+    Goes under ``@mcp.tool()`` / ``@mcp.resource()``. functools.wraps keeps the
+    signature visible, so FastMCP still builds the same schema from it.
+    """
+
+    def decorator(fn):
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            trace_token = _trace_id.set(_trace_id.get() or uuid.uuid4().hex[:16])
+            span_token = _span_name.set(name)
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                _calls[(kind, name, outcome)] += 1
+                _observe(_call_latency, (kind, name), elapsed)
+                logger.log(
+                    logging.WARNING if outcome == "error" else logging.DEBUG,
+                    "trace=%s %s %s %s in %.1fms", _trace_id.get(), kind, name, outcome, elapsed * 1000,
+                )
+                _span_name.reset(span_token)
+                _trace_id.reset(trace_token)
+
+        return wrapper
+
+    return decorator
+
+
+def _server_timing(resp: httpx.Response) -> Optional[float]:
+    """Seconds the backend says it spent, from ``Server-Timing: app;dur=<ms>``."""
+    match = re.search(r"\bapp;dur=([0-9.]+)", resp.headers.get("server-timing", ""))
+    return float(match.group(1)) / 1000 if match else None
+
+
+def _retry_delay(resp: Optional[httpx.Response], attempt: int) -> float:
+    delay = 0.25 * 2 ** attempt
+    if resp is not None:
+        try:
+            delay = max(delay, float(resp.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return min(delay, 5.0)
+
+
+async def _request(method: str, path: str, **kwargs) -> httpx.Response:
+    """One backend call, traced and counted.
+
+    Retries connect failures (the request never left) and 429/503 (the
+    backend's admission control shed it before doing anything), so retrying
+    never runs a write twice. Anything else is the caller's to interpret.
+    """
+    name = _span_name.get()
+    headers = {**kwargs.pop("headers", {}), TRACE_HEADER: _trace_id.get() or uuid.uuid4().hex[:16]}
+    async with httpx.AsyncClient() as client:
+        for attempt in range(BACKEND_RETRIES + 1):
+            resp = None
+            started = time.perf_counter()
+            try:
+                resp = await client.request(method, _backend(path), headers=headers, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                _backend_statuses[(name, "connect_error")] += 1
+                if attempt == BACKEND_RETRIES:
+                    raise
+                _backend_retries[(name, "connect_error")] += 1
+            else:
+                _observe(_backend_latency, name, time.perf_counter() - started)
+                server = _server_timing(resp)
+                if server is not None:
+                    _observe(_backend_server, name, server)
+                _backend_statuses[(name, str(resp.status_code))] += 1
+                if resp.status_code not in RETRY_STATUSES or attempt == BACKEND_RETRIES:
+                    return resp
+                _backend_retries[(name, str(resp.status_code))] += 1
+            await asyncio.sleep(_retry_delay(resp, attempt))
+    raise AssertionError("unreachable")
+
+
+def _histogram_lines(metric: str, table: dict, labels) -> list[str]:
+    lines = []
+    for key, hist in sorted(table.items()):
+        label = labels(key)
+        for bound, count in zip(LATENCY_BUCKETS, hist.buckets):
+            lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {hist.count}')
+        lines.append(f"{metric}_sum{{{label}}} {hist.sum:.6f}")
+        lines.append(f"{metric}_count{{{label}}} {hist.count}")
+    return lines
+
+
+def _render_metrics() -> str:
+    """Everything above, in Prometheus text format."""
+    lines = [
+        "# HELP qtodo_mcp_calls_total MCP tool and resource calls by outcome",
+        "# TYPE qtodo_mcp_calls_total counter",
+    ]
+    for (kind, name, outcome), n in sorted(_calls.items()):
+        lines.append(f'qtodo_mcp_calls_total{{kind="{kind}",name="{name}",outcome="{outcome}"}} {n}')
+    lines += [
+        "# HELP qtodo_mcp_call_seconds Wall time of each MCP call, backend included",
+        "# TYPE qtodo_mcp_call_seconds histogram",
+    ]
+    lines += _histogram_lines("qtodo_mcp_call_seconds", _call_latency, lambda k: f'kind="{k[0]}",name="{k[1]}"')
+    lines += [
+        "# HELP qtodo_mcp_backend_seconds Time per backend HTTP attempt, network included",
+        "# TYPE qtodo_mcp_backend_seconds histogram",
+    ]
+    lines += _histogram_lines("qtodo_mcp_backend_seconds", _backend_latency, lambda k: f'name="{k}"')
+    lines += [
+        "# HELP qtodo_mcp_backend_server_seconds Time the backend reports spending (Server-Timing)",
+        "# TYPE qtodo_mcp_backend_server_seconds histogram",
+    ]
+    lines += _histogram_lines("qtodo_mcp_backend_server_seconds", _backend_server, lambda k: f'name="{k}"')
+    lines += [
+        "# HELP qtodo_mcp_backend_responses_total Backend responses by status (connect_error if none)",
+        "# TYPE qtodo_mcp_backend_responses_total counter",
+    ]
+    for (name, status), n in sorted(_backend_statuses.items()):
+        lines.append(f'qtodo_mcp_backend_responses_total{{name="{name}",status="{status}"}} {n}')
+    lines += [
+        "# HELP qtodo_mcp_backend_retries_total Backend calls retried, by reason",
+        "# TYPE qtodo_mcp_backend_retries_total counter",
+    ]
+    for (name, reason), n in sorted(_backend_retries.items()):
+        lines.append(f'qtodo_mcp_backend_retries_total{{name="{name}",reason="{reason}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
 # ── User management ───────────────────────────────────────────────────────────
 
 @mcp.tool()
+@_traced("tool")
 async def register_user(username: str, password: str) -> dict:
     """
     Register a new user account on the QTodo backend.
@@ -50,12 +266,7 @@ async def register_user(username: str, password: str) -> dict:
 
     Returns: {"id": <user_id>} on success.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/users/register"),
-            json={"username": username, "password": password},
-            timeout=10,
-        )
+    resp = await _request("POST", "/users/register", json={"username": username, "password": password}, timeout=10)
     if resp.status_code == 400:
         return {"error": "username already taken — creativity is required"}
     resp.raise_for_status()
@@ -63,6 +274,7 @@ async def register_user(username: str, password: str) -> dict:
 
 
 @mcp.tool()
+@_traced("tool")
 async def login_user(username: str, password: str) -> dict:
     """
     Log in to an existing user account.
@@ -71,12 +283,7 @@ async def login_user(username: str, password: str) -> dict:
     or {"error": <message>} if credentials are wrong.
     The backend stores no session — pass user_id to subsequent calls.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/users/login"),
-            json={"username": username, "password": password},
-            timeout=10,
-        )
+    resp = await _request("POST", "/users/login", json={"username": username, "password": password}, timeout=10)
     if resp.status_code == 401:
         return {"error": "wrong credentials — the machine rejects you"}
     resp.raise_for_status()
@@ -86,24 +293,29 @@ async def login_user(username: str, password: str) -> dict:
 # ── Task management ───────────────────────────────────────────────────────────
 
 @mcp.tool()
-async def list_tasks(user_id: int) -> dict:
+@_traced("tool")
+async def list_tasks(user_id: int, include_archived: bool = False) -> dict:
     """
     List all tasks for a user from the server-side SQLite database.
 
-    Note: the frontend also maintains a localStorage task list that is
-    independent of this. You are reading the server's copy.
-    The two may diverge. This is fine. This is called "eventual consistency."
-    We tell ourselves this.
+    Note: the frontend keeps its own task list in localStorage. Browsers
+    with a sync user id set reconcile it with this copy via /sync, so
+    changes made here reach them on their next sync. Browsers without one
+    diverge freely. This is called "eventual consistency." We tell ourselves this.
+
+    Tasks completed long ago are archived server-side and left out unless
+    include_archived is true, in which case each item also has "archived".
 
     Returns: {"todos": [{"id", "text", "done", "created"}, ...]}
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(_backend(f"/todos/{user_id}"), timeout=10)
+    params = {"include_archived": "true"} if include_archived else None
+    resp = await _request("GET", f"/todos/{user_id}", params=params, headers=LIST_HEADERS, timeout=10)
     resp.raise_for_status()
-    return resp.json()
+    return _decode(resp)
 
 
 @mcp.tool()
+@_traced("tool")
 async def add_task(user_id: int, text: str) -> dict:
     """
     Add a new task for a user on the server-side database.
@@ -114,17 +326,13 @@ async def add_task(user_id: int, text: str) -> dict:
 
     Returns: {"id": <task_id>}
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/todos/add"),
-            json={"user_id": user_id, "text": text},
-            timeout=10,
-        )
+    resp = await _request("POST", "/todos/add", json={"user_id": user_id, "text": text}, timeout=10)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool()
+@_traced("tool")
 async def complete_task(task_id: int) -> dict:
     """
     Mark a server-side task as completed.
@@ -134,13 +342,13 @@ async def complete_task(task_id: int) -> dict:
 
     Returns: {"ok": true, "task_id": <id>}
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.put(_backend(f"/todos/{task_id}/done"), timeout=10)
+    resp = await _request("PUT", f"/todos/{task_id}/done", timeout=10)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool()
+@_traced("tool")
 async def delete_task(task_id: int) -> dict:
     """
     Delete a task by ID. No shame points are recorded server-side.
@@ -148,8 +356,7 @@ async def delete_task(task_id: int) -> dict:
 
     Returns: {"ok": true, "task_id": <id>}
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.delete(_backend(f"/todos/{task_id}"), timeout=10)
+    resp = await _request("DELETE", f"/todos/{task_id}", timeout=10)
     resp.raise_for_status()
     return resp.json()
 
@@ -157,7 +364,8 @@ async def delete_task(task_id: int) -> dict:
 # ── OpenTimestamps ────────────────────────────────────────────────────────────
 
 @mcp.tool()
-async def create_timestamp_proof(hash_hex: str) -> dict:
+@_traced("tool")
+async def create_timestamp_proof(hash_hex: str, user_id: int | None = None) -> dict:
     """
     Submit a SHA-256 hash to the OpenTimestamps calendar network for
     Bitcoin timestamping.
@@ -167,21 +375,20 @@ async def create_timestamp_proof(hash_hex: str) -> dict:
     in a Bitcoin transaction. This takes ~hours for a pending proof to
     upgrade to a Bitcoin-confirmed proof.
 
+    Pass user_id to file the proof under that user, so it shows up in
+    their /ots/export. The first owner of a hash keeps it.
+
     Returns: {"proof": "<base64-encoded OTS proof>"}
     The proof should be stored and later passed to upgrade_timestamp_proof
     to check if Bitcoin has confirmed it.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/ots/create"),
-            json={"hash": hash_hex},
-            timeout=30,
-        )
+    resp = await _request("POST", "/ots/create", json={"hash": hash_hex, "user_id": user_id}, timeout=30)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool()
+@_traced("tool")
 async def upgrade_timestamp_proof(proof_b64: str) -> dict:
     """
     Attempt to upgrade a pending OTS proof by contacting the calendar servers.
@@ -194,17 +401,13 @@ async def upgrade_timestamp_proof(proof_b64: str) -> dict:
     The updated proof may or may not be confirmed; use verify_timestamp_proof
     to check.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/ots/upgrade"),
-            json={"proof": proof_b64},
-            timeout=30,
-        )
+    resp = await _request("POST", "/ots/upgrade", json={"proof": proof_b64}, timeout=30)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool()
+@_traced("tool")
 async def verify_timestamp_proof(hash_hex: str, proof_b64: str) -> dict:
     """
     Verify whether a timestamp proof has been confirmed by Bitcoin.
@@ -213,12 +416,7 @@ async def verify_timestamp_proof(hash_hex: str, proof_b64: str) -> dict:
     True means a Bitcoin miner has unknowingly immortalised a hash that
     probably represents someone's grocery list.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            _backend("/ots/verify"),
-            json={"hash": hash_hex, "proof": proof_b64},
-            timeout=30,
-        )
+    resp = await _request("POST", "/ots/verify", json={"hash": hash_hex, "proof": proof_b64}, timeout=30)
     resp.raise_for_status()
     return resp.json()
 
@@ -226,6 +424,7 @@ async def verify_timestamp_proof(hash_hex: str, proof_b64: str) -> dict:
 # ── EVM / Blockchain ──────────────────────────────────────────────────────────
 
 @mcp.tool()
+@_traced("tool")
 async def anchor_hash_on_chain(
     hash_hex: str,
     ref: str,
@@ -271,8 +470,7 @@ async def anchor_hash_on_chain(
     if mode:
         payload["mode"] = mode
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(_backend("/evm/anchor"), json=payload, timeout=60)
+    resp = await _request("POST", "/evm/anchor", json=payload, timeout=60)
     if resp.status_code == 500:
         return {"error": resp.json().get("detail", "EVM anchor failed")}
     resp.raise_for_status()
@@ -282,6 +480,7 @@ async def anchor_hash_on_chain(
 # ── Server status ─────────────────────────────────────────────────────────────
 
 @mcp.tool()
+@_traced("tool")
 async def get_server_health() -> dict:
     """
     Check the health of the QTodo backend server.
@@ -290,13 +489,13 @@ async def get_server_health() -> dict:
     configuration, and a philosophical note. The philosophical note is
     not optional; it is load-bearing.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(_backend("/health"), timeout=10)
+    resp = await _request("GET", "/health", timeout=10)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool()
+@_traced("tool")
 async def get_metrics() -> str:
     """
     Fetch Prometheus-format metrics from the QTodo backend.
@@ -308,8 +507,7 @@ async def get_metrics() -> str:
 
     Returns raw Prometheus text format.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(_backend("/metrics"), timeout=10)
+    resp = await _request("GET", "/metrics", timeout=10)
     resp.raise_for_status()
     return resp.text
 
@@ -317,6 +515,7 @@ async def get_metrics() -> str:
 # ── Resources ─────────────────────────────────────────────────────────────────
 
 @mcp.resource("qtodo://tasks/{user_id}")
+@_traced("resource")
 async def tasks_resource(user_id: str) -> str:
     """
     Expose a user's task list as an MCP resource.
@@ -325,11 +524,10 @@ async def tasks_resource(user_id: str) -> str:
     without invoking the list_tasks tool. Useful for context injection
     in prompts that need task awareness without a tool round-trip.
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(_backend(f"/todos/{user_id}"), timeout=10)
+    resp = await _request("GET", f"/todos/{user_id}", headers=LIST_HEADERS, timeout=10)
     if not resp.is_success:
         return f"Could not fetch tasks for user {user_id}: {resp.status_code}"
-    todos = resp.json().get("todos", [])
+    todos = _decode(resp).get("todos", [])
     if not todos:
         return f"User {user_id} has no tasks. Either done or in denial."
     lines = [f"Tasks for user {user_id}:"]
@@ -340,10 +538,10 @@ async def tasks_resource(user_id: str) -> str:
 
 
 @mcp.resource("qtodo://health")
+@_traced("resource")
 async def health_resource() -> str:
     """Backend health as a plain-text resource."""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(_backend("/health"), timeout=10)
+    resp = await _request("GET", "/health", timeout=10)
     if not resp.is_success:
         return "Backend is down. Or sulking. It's hard to tell."
     h = resp.json()
@@ -357,6 +555,29 @@ async def health_resource() -> str:
     )
 
 
+@mcp.resource("qtodo://metrics/mcp")
+@_traced("resource")
+async def mcp_metrics_resource() -> str:
+    """
+    This server's own call counts, latency histograms, backend status codes
+    and retries, in Prometheus text format. Not the backend's metrics; those
+    are what get_metrics is for.
+    """
+    return _render_metrics()
+
+
+# Scrapers can't read MCP resources, so the SSE transport also serves the same
+# text over plain HTTP. custom_route arrived in mcp 1.7; older versions
+# simply go without.
+if METRICS_PATH and hasattr(mcp, "custom_route"):
+    from starlette.requests import Request
+    from starlette.responses import PlainTextResponse
+
+    @mcp.custom_route(METRICS_PATH, methods=["GET"])
+    async def metrics_endpoint(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(_render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import sys
     transport = "sse" if "--transport" in sys.argv and sys.argv[sys.argv.index("--transport") + 1] == "sse" else "stdio"
@@ -1,15 +1,32 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import Match
 from pydantic import BaseModel
 import base64
+import gzip
 import hashlib
+import hmac
+import threading
 import io
 import json
+import math
+import multiprocessing
 import os
+import queue
+import re
+import struct
+import tarfile
 import time
 import logging
 import sqlite3
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 # The opentimestamps library exists because apparently just checking your watch
 # wasn't authoritative enough. We need Bitcoin—a globally-distributed
@@ -19,19 +36,59 @@ from opentimestamps.core.timestamp import DetachedTimestampFile, Timestamp
 from opentimestamps.core.op import OpSHA256
 from opentimestamps.core.notary import PendingAttestation, BitcoinBlockHeaderAttestation
 from opentimestamps.core.serialize import StreamSerializationContext, StreamDeserializationContext
-from opentimestamps.calendar import RemoteCalendar, DEFAULT_AGGREGATORS
+from opentimestamps.calendar import (
+    RemoteCalendar, CommitmentNotFoundError, UrlWhitelist, DEFAULT_AGGREGATORS, DEFAULT_CALENDAR_WHITELIST,
+)
 
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+import verify_worker
+from verify_worker import BlockHeaderStore
+
+# Optional speed-ups. Each one is picked up if installed and quietly skipped if
+# not, because the todo list must go on.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 START_TIME = time.time()
 
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Background work that runs while the server does.
+
+    The archiver starts with the server. On the way out it stops, the batch
+    verification pool goes, and the group-commit writer is closed last,
+    after anything that might still hand it a write.
+    """
+    _start_archiver()
+    try:
+        yield
+    finally:
+        _archive_stop.set()
+        _shutdown_verify_pool()
+        writer.close()
+
+
 app = FastAPI(
     title="QTodo Retro Server",
     description="A microservice that exists solely to make a todo list feel important.",
     version="0.0.0-eternal-beta",
+    lifespan=_lifespan,
 )
 
 # CORS: because browsers are paranoid and the internet is not.
@@ -58,7 +115,10 @@ ASCII_ART = r"""
 
 print(ASCII_ART)
 
-db = sqlite3.connect('todo.db', check_same_thread=False)
+# The Dockerfile has been setting SQLITE_PATH since day one. Now somebody reads it.
+DB_PATH = os.getenv('SQLITE_PATH', 'todo.db')
+
+db = sqlite3.connect(DB_PATH, check_same_thread=False)
 db.execute(
     'CREATE TABLE IF NOT EXISTS users '
     '(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT)'
@@ -69,8 +129,187 @@ db.execute(
     'done INTEGER DEFAULT 0, created TIMESTAMP DEFAULT CURRENT_TIMESTAMP, '
     'FOREIGN KEY(user_id) REFERENCES users(id))'
 )
+
+
+def _ensure_column(table: str, column: str, decl: str) -> None:
+    """ALTER TABLE for databases created before ``column`` existed."""
+    if column not in {row[1] for row in db.execute(f'PRAGMA table_info({table})')}:
+        db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+_ensure_column('todos', 'completed', 'TIMESTAMP')
+db.execute('CREATE INDEX IF NOT EXISTS todos_user ON todos (user_id)')
+# Delta sync bookkeeping (see /sync). client_id is the frontend's id for the
+# task ('srv-<id>' for tasks created through the API), data its full JSON,
+# seq the per-user sequence number of its last change, updated_at the
+# change's wall-clock time in ms. Deletes leave a tombstone behind.
+_ensure_column('todos', 'client_id', 'TEXT')
+_ensure_column('todos', 'data', 'TEXT')
+_ensure_column('todos', 'seq', 'INTEGER DEFAULT 0')
+_ensure_column('todos', 'deleted', 'INTEGER DEFAULT 0')
+_ensure_column('todos', 'updated_at', 'INTEGER')
+db.execute("UPDATE todos SET client_id = 'srv-' || id WHERE client_id IS NULL")
+db.execute('CREATE UNIQUE INDEX IF NOT EXISTS todos_user_client ON todos (user_id, client_id)')
+db.execute('CREATE INDEX IF NOT EXISTS todos_user_seq ON todos (user_id, seq)')
+# seq is the user's latest sequence number; anything at or below floor has
+# been archived or purged, so a client that last synced before it starts over.
+db.execute(
+    'CREATE TABLE IF NOT EXISTS sync_state '
+    '(user_id INTEGER PRIMARY KEY, seq INTEGER DEFAULT 0, floor INTEGER DEFAULT 0)'
+)
+
+
+def _backfill_sync(cur) -> None:
+    """Give todos from before delta sync a seq and updated_at of their own.
+
+    Rows written before the columns existed have seq 0, which no client's
+    ``since`` is below, so /sync would never send them. Each such user's seq
+    moves on by one and their old rows all take it.
+    """
+    cur.execute(
+        "UPDATE todos SET updated_at = CAST(strftime('%s', COALESCE(completed, created)) AS INTEGER) * 1000 "
+        'WHERE updated_at IS NULL'
+    )
+    legacy = 'SELECT DISTINCT user_id FROM todos WHERE COALESCE(seq, 0) = 0 AND user_id IS NOT NULL'
+    cur.execute(f'INSERT OR IGNORE INTO sync_state (user_id) {legacy}')
+    cur.execute(f'UPDATE sync_state SET seq = seq + 1 WHERE user_id IN ({legacy})')
+    cur.execute(
+        'UPDATE todos SET seq = (SELECT seq FROM sync_state WHERE sync_state.user_id = todos.user_id) '
+        'WHERE COALESCE(seq, 0) = 0 AND user_id IS NOT NULL'
+    )
+
+
+_backfill_sync(db)
+# Cold storage for long-finished todos, so the hot table only holds what
+# people are actually (not) doing. Rows keep their original ids.
+db.execute(
+    'CREATE TABLE IF NOT EXISTS todos_archive '
+    '(id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, done INTEGER, '
+    'created TIMESTAMP, completed TIMESTAMP, '
+    'archived TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+)
+_ensure_column('todos_archive', 'client_id', 'TEXT')
+_ensure_column('todos_archive', 'data', 'TEXT')
+_ensure_column('todos_archive', 'updated_at', 'INTEGER')
+db.execute('CREATE INDEX IF NOT EXISTS todos_archive_user ON todos_archive (user_id)')
+db.execute('CREATE INDEX IF NOT EXISTS todos_archive_user_client ON todos_archive (user_id, client_id)')
+# Completed OTS proofs and EVM transactions, keyed by whatever made the request
+# unique. Repeats get the stored bytes back instead of another calendar round
+# trip or another bill from the gas station.
+db.execute(
+    'CREATE TABLE IF NOT EXISTS idempotency '
+    '(key TEXT PRIMARY KEY, fingerprint TEXT, result BLOB, '
+    'created TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+)
+# Every proof we have ever minted or upgraded, as raw bytes. This is the
+# archive that /ots/export streams out.
+db.execute(
+    'CREATE TABLE IF NOT EXISTS proofs '
+    '(hash TEXT PRIMARY KEY, user_id INTEGER, proof BLOB, '
+    'created TIMESTAMP DEFAULT CURRENT_TIMESTAMP, '
+    'updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+)
+db.execute('CREATE INDEX IF NOT EXISTS proofs_user_created ON proofs (user_id, created)')
 db.commit()
 
+# SQLite files never shrink on their own. Incremental auto-vacuum lets the
+# archival job hand freed pages back to the filesystem a few at a time; an
+# existing file needs one full VACUUM to switch modes.
+if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+    logger.info('Switching %s to incremental auto-vacuum (one-time full VACUUM)', DB_PATH)
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute('VACUUM')
+
+
+# ── Group commit ────────────────────────────────────────────────────────────
+# Every mutation used to commit on its own: one fsync per write, which on EFS
+# caps throughput at one over the fsync latency. Mutations now go to a single
+# writer thread that runs whatever has queued up in the last GROUP_COMMIT_MS
+# (at most GROUP_COMMIT_MAX_OPS) in one transaction. Each caller gets its own
+# result or exception once the shared COMMIT is durable. The shared `db`
+# connection is only used for reads from here on.
+
+GROUP_COMMIT_WINDOW = float(os.getenv('GROUP_COMMIT_MS', '2')) / 1000
+GROUP_COMMIT_MAX_OPS = int(os.getenv('GROUP_COMMIT_MAX_OPS', '64'))
+
+
+class GroupCommitWriter:
+    """Single-threaded SQLite writer that batches callers into shared transactions."""
+
+    def __init__(self, path: str):
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._queue: queue.Queue = queue.Queue()
+        self.batches = 0
+        self.ops = 0
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, op):
+        """Run ``op(cursor)`` inside the next batch; returns its result once committed.
+
+        If ``op`` raises, only its own changes are rolled back (it runs inside a
+        savepoint) and the exception is re-raised here, in the caller's thread.
+        """
+        fut = Future()
+        self._queue.put((op, fut))
+        return fut.result()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX_OPS:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: list) -> None:
+        cur = self._conn.cursor()
+        outcomes = []
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+            for op, _ in batch:
+                cur.execute('SAVEPOINT op')
+                try:
+                    outcomes.append((op(cur), None))
+                except BaseException as exc:
+                    cur.execute('ROLLBACK TO op')
+                    outcomes.append((None, exc))
+                cur.execute('RELEASE op')
+            cur.execute('COMMIT')
+        except BaseException as exc:
+            logger.exception('Group commit of %d ops failed', len(batch))
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            for _, fut in batch:
+                fut.set_exception(exc)
+            return
+        self.batches += 1
+        self.ops += len(batch)
+        for (_, fut), (result, exc) in zip(batch, outcomes):
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+
+writer = GroupCommitWriter(DB_PATH)
+
 # This server exists mainly so hashes can feel important before fading into
 # obscurity. Think of it as a timestamping spa for anxious cryptographic digests.
 
@@ -147,6 +386,416 @@ else:
     logger.warning('EVM not configured; blockchain features disabled (your tasks remain unanchored, unwitnessed, and fundamentally ephemeral)')
 
 
+# ── Calendar health ─────────────────────────────────────────────────────────
+# One calendar having a bad day used to cost every request the full timeout
+# before we moved on. Each calendar now gets an EWMA of its latency and error
+# rate plus a circuit breaker: after BREAKER_FAILURES consecutive failures it
+# is skipped for BREAKER_COOLDOWN seconds, then a single half-open probe
+# decides whether it is back.
+
+CALENDARS = [u.strip() for u in os.getenv('OTS_CALENDARS', '').split(',') if u.strip()] or list(DEFAULT_AGGREGATORS)
+CALENDAR_K = int(os.getenv('OTS_CALENDAR_K', '2'))
+CALENDAR_TIMEOUT = float(os.getenv('OTS_CALENDAR_TIMEOUT', '8'))
+BREAKER_FAILURES = int(os.getenv('OTS_BREAKER_FAILURES', '3'))
+BREAKER_COOLDOWN = float(os.getenv('OTS_BREAKER_COOLDOWN', '60'))
+# Pending attestations name the calendar to upgrade from, and the proof comes
+# from the client. Only calendars on this list (ours, the library's default
+# patterns and OTS_CALENDAR_WHITELIST) are ever contacted, and at most
+# CALENDAR_HEALTH_MAX of them get a health entry of their own.
+CALENDAR_WHITELIST = UrlWhitelist(
+    CALENDARS + [u.strip() for u in os.getenv('OTS_CALENDAR_WHITELIST', '').split(',') if u.strip()]
+)
+CALENDAR_WHITELIST.update(DEFAULT_CALENDAR_WHITELIST)
+CALENDAR_HEALTH_MAX = 64
+EWMA_ALPHA = 0.2
+
+
+class CalendarHealth:
+    """Latency, error rate and breaker state for one calendar URL."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probing = False
+        self.successes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May we send this calendar a request right now?"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self.state = 'half_open'
+                self.probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        with self._lock:
+            self.latency = elapsed if self.latency is None else (
+                EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+            self.probing = False
+            if ok:
+                self.successes += 1
+                self.consecutive_failures = 0
+                self.state = 'closed'
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or self.consecutive_failures >= BREAKER_FAILURES:
+                if self.state != 'open':
+                    logger.warning('Calendar %s tripped its breaker; ignoring it for %ss', self.url, BREAKER_COOLDOWN)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def score(self) -> float:
+        """Lower is healthier. Unknown calendars are assumed mediocre, not perfect."""
+        latency = self.latency if self.latency is not None else CALENDAR_TIMEOUT / 4
+        # A fast "connection refused" is not a fast calendar: charge each
+        # failure as if it had cost a full timeout.
+        return latency + self.error_rate * CALENDAR_TIMEOUT
+
+    def snapshot(self) -> dict:
+        return {
+            'state': self.state,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'successes': self.successes,
+            'failures': self.failures,
+        }
+
+
+_calendar_health: dict[str, CalendarHealth] = {}
+_calendar_health_lock = threading.Lock()
+
+
+def _health_for(url: str) -> CalendarHealth:
+    with _calendar_health_lock:
+        h = _calendar_health.get(url)
+        if h is None:
+            h = CalendarHealth(url)
+            # Past the cap a calendar still gets a breaker for this request,
+            # just not a permanent slot in /health and /metrics.
+            if url in CALENDARS or len(_calendar_health) < CALENDAR_HEALTH_MAX:
+                _calendar_health[url] = h
+        return h
+
+
+def _label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _ranked_calendars() -> list[CalendarHealth]:
+    return sorted((_health_for(url) for url in CALENDARS), key=CalendarHealth.score)
+
+
+def _calendar_metrics() -> str:
+    lines = [
+        '# HELP qtodo_calendar_up 1 if the calendar breaker is closed, 0.5 half-open, 0 open',
+        '# TYPE qtodo_calendar_up gauge',
+    ]
+    with _calendar_health_lock:
+        healths = list(_calendar_health.values())
+    state_value = {'closed': 1, 'half_open': 0.5, 'open': 0}
+    for h in healths:
+        lines.append(f'qtodo_calendar_up{{calendar="{_label(h.url)}"}} {state_value[h.state]}')
+    lines += [
+        '# HELP qtodo_calendar_latency_seconds EWMA of calendar response time',
+        '# TYPE qtodo_calendar_latency_seconds gauge',
+    ]
+    for h in healths:
+        if h.latency is not None:
+            lines.append(f'qtodo_calendar_latency_seconds{{calendar="{_label(h.url)}"}} {h.latency:.4f}')
+    lines += [
+        '# HELP qtodo_calendar_error_rate EWMA of calendar failures (0..1)',
+        '# TYPE qtodo_calendar_error_rate gauge',
+    ]
+    for h in healths:
+        lines.append(f'qtodo_calendar_error_rate{{calendar="{_label(h.url)}"}} {h.error_rate:.4f}')
+    lines += [
+        '# HELP qtodo_calendar_requests_total Calendar requests by outcome',
+        '# TYPE qtodo_calendar_requests_total counter',
+    ]
+    for h in healths:
+        lines.append(f'qtodo_calendar_requests_total{{calendar="{_label(h.url)}",outcome="ok"}} {h.successes}')
+        lines.append(f'qtodo_calendar_requests_total{{calendar="{_label(h.url)}",outcome="error"}} {h.failures}')
+    return '\n'.join(lines) + '\n'
+
+
+# ── Admission control ───────────────────────────────────────────────────────
+# One runaway agent used to be able to fan out to every calendar and RPC node
+# we know. Now each client gets a token bucket (RATE_LIMIT_RPS sustained,
+# RATE_LIMIT_BURST deep), and the expensive routes get a cap on concurrent
+# requests. Over either limit we answer immediately with 429/503 and a
+# Retry-After, rather than letting a queue grow until everyone times out.
+
+RATE_LIMIT_RPS = float(os.getenv('RATE_LIMIT_RPS', '10'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '40'))
+RATE_LIMIT_CLIENTS = 10_000
+# Proxies in front of us that append to X-Forwarded-For (1 behind the ALB).
+# Hops further left than theirs were written by the client and prove nothing.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+ROUTE_MAX_INFLIGHT = {
+    '/ots/create': 16,
+    '/ots/create/raw': 16,
+    '/ots/upgrade': 16,
+    '/ots/upgrade/raw': 16,
+    '/ots/verify/batch': 4,
+    '/evm/anchor': 4,
+    '/evm/verify': 8,
+    '/evm/verify/batch': 4,
+    '/ots/export': 2,
+}
+# e.g. ROUTE_MAX_INFLIGHT="/evm/anchor=2,/ots/create=32"
+for _item in filter(None, os.getenv('ROUTE_MAX_INFLIGHT', '').split(',')):
+    _route, _, _limit = _item.partition('=')
+    ROUTE_MAX_INFLIGHT[_route.strip()] = int(_limit)
+UNLIMITED_PATHS = {'/', '/health', '/metrics', '/ws'}
+
+# All of this state is touched only from the event loop, so no locks.
+_buckets: OrderedDict[str, list[float]] = OrderedDict()
+_route_inflight: Counter[str] = Counter()
+_shed: Counter[tuple[str, str]] = Counter()
+
+
+def _client_key(request: Request) -> str:
+    """The caller's address, as seen by the outermost proxy we trust.
+
+    Nothing the client merely claims (API keys, user ids) is used: the server
+    verifies none of them, and a fresh one per request would be a fresh bucket.
+    """
+    if TRUSTED_PROXY_HOPS:
+        hops = [h.strip() for h in request.headers.get('x-forwarded-for', '').split(',') if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return 'ip:' + hops[-TRUSTED_PROXY_HOPS]
+    return 'ip:' + (request.client.host if request.client else 'unknown')
+
+
+def _take_token(client: str) -> float:
+    """Spend one token; returns 0 on success or the seconds until one is available."""
+    now = time.monotonic()
+    bucket = _buckets.pop(client, None) or [RATE_LIMIT_BURST, now]
+    bucket[0] = min(RATE_LIMIT_BURST, bucket[0] + (now - bucket[1]) * RATE_LIMIT_RPS)
+    bucket[1] = now
+    _buckets[client] = bucket
+    if len(_buckets) > RATE_LIMIT_CLIENTS:
+        _buckets.popitem(last=False)
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return 0.0
+    return (1 - bucket[0]) / RATE_LIMIT_RPS
+
+
+def _route_label(request: Request) -> str:
+    """The route template (``/todos/{user_id}``), so metrics don't get one series per id."""
+    for route in app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+def _shed_response(request: Request, reason: str, status: int, retry_after: float, detail: str) -> JSONResponse:
+    _shed[(_route_label(request), reason)] += 1
+    return JSONResponse(
+        {'detail': detail},
+        status_code=status,
+        headers={'Retry-After': str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class _AdmissionControl:
+    """Plain ASGI rather than BaseHTTPMiddleware: call_next returns as soon as
+    the headers are out, which would release a streaming export's slot before
+    its body has even started. Here the slot is held until the app is done
+    sending, or gives up because the client left."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        path = request.url.path
+        if request.method == 'OPTIONS' or path in UNLIMITED_PATHS:
+            return await self.app(scope, receive, send)
+        if RATE_LIMIT_RPS > 0:
+            wait = _take_token(_client_key(request))
+            if wait:
+                shed = _shed_response(request, 'rate_limited', 429, wait, 'rate limit exceeded; patience is a virtue')
+                return await shed(scope, receive, send)
+        limit = ROUTE_MAX_INFLIGHT.get(path)
+        if limit is None:
+            return await self.app(scope, receive, send)
+        if _route_inflight[path] >= limit:
+            shed = _shed_response(request, 'saturated', 503, 1, 'server saturated; the calendars need a minute')
+            return await shed(scope, receive, send)
+        _route_inflight[path] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _route_inflight[path] -= 1
+
+
+# Appended rather than added so it sits inside CORSMiddleware and shed
+# responses still carry CORS headers the browser will accept.
+app.user_middleware.append(Middleware(_AdmissionControl))
+
+
+def _admission_metrics() -> str:
+    lines = [
+        '# HELP qtodo_requests_shed_total Requests turned away by admission control',
+        '# TYPE qtodo_requests_shed_total counter',
+    ]
+    for (route, reason), count in sorted(_shed.items()):
+        lines.append(f'qtodo_requests_shed_total{{route="{route}",reason="{reason}"}} {count}')
+    lines += [
+        '# HELP qtodo_requests_inflight Requests currently running on capped routes',
+        '# TYPE qtodo_requests_inflight gauge',
+    ]
+    for route in sorted(ROUTE_MAX_INFLIGHT):
+        lines.append(f'qtodo_requests_inflight{{route="{route}"}} {_route_inflight[route]}')
+    return '\n'.join(lines) + '\n'
+
+
+# ── Request tracing ─────────────────────────────────────────────────────────
+# Callers (the MCP server, mostly) send X-Trace-Id. For the life of the
+# request it is tagged onto every log line, calendar grumbles included, and
+# the response carries Server-Timing so the caller can tell our time apart
+# from the network's. Added last, so it is outermost and times shed requests too.
+
+TRACE_HEADER = 'X-Trace-Id'
+_TRACE_ID_RE = re.compile(r'[A-Za-z0-9._-]{1,64}')
+_trace_id: ContextVar[str | None] = ContextVar('trace_id', default=None)
+
+
+class _TraceLogFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _trace_id.get()
+        record.trace = f' [trace={trace}]' if trace else ''
+        return True
+
+
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(_TraceLogFilter())
+    _handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s%(trace)s'))
+
+
+async def _trace_requests(request: Request, call_next):
+    trace = request.headers.get(TRACE_HEADER)
+    if trace is None or not _TRACE_ID_RE.fullmatch(trace):
+        trace = None
+    token = _trace_id.set(trace)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.headers['Server-Timing'] = f'app;dur={elapsed_ms:.1f}'
+        if trace:
+            # Still inside the trace context, so the log filter tags the line.
+            response.headers[TRACE_HEADER] = trace
+            logger.info('%s %s -> %d in %.1fms', request.method, request.url.path,
+                        response.status_code, elapsed_ms)
+        return response
+    finally:
+        _trace_id.reset(token)
+
+
+app.add_middleware(BaseHTTPMiddleware, dispatch=_trace_requests)
+
+
+# ── Response encoding ───────────────────────────────────────────────────────
+# Hot routes skip FastAPI's jsonable_encoder + json.dumps round trip: payloads
+# are encoded once with orjson (or msgpack, if the client asks for it via
+# Accept) and compressed with brotli or gzip once they're big enough to care.
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+MSGPACK_TYPE = 'application/msgpack'
+
+
+def _accepts(header: str | None, token: str) -> bool:
+    """True if ``token`` appears in an Accept-style header with a non-zero q."""
+    for part in (header or '').split(','):
+        name, *params = (p.strip() for p in part.split(';'))
+        if name.lower() != token:
+            continue
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _compressed(request: Request, body: bytes, media_type: str) -> Response:
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accept_encoding = request.headers.get('accept-encoding')
+        if brotli is not None and _accepts(accept_encoding, 'br'):
+            body = brotli.compress(body, quality=4)
+            headers['Content-Encoding'] = 'br'
+        elif _accepts(accept_encoding, 'gzip'):
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def _render(request: Request, payload) -> Response:
+    """Encode ``payload`` the way the client asked for it, then maybe compress."""
+    if msgpack is not None and _accepts(request.headers.get('accept'), MSGPACK_TYPE):
+        return _compressed(request, msgpack.packb(payload, use_bin_type=True), MSGPACK_TYPE)
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+    return _compressed(request, body, 'application/json')
+
+
+# ── Bitcoin block headers ───────────────────────────────────────────────────
+# A BitcoinBlockHeaderAttestation claims "this digest is the merkle root of
+# block N". Until now we took its word for it. Checking means knowing block
+# N's header, and asking a remote explorer per proof is slow and rude, so we
+# keep the chain's headers locally: 80 bytes each, back to back from genesis,
+# so block N lives at offset N * 80 and a lookup is one slice of an mmap.
+#
+# BTC_HEADERS_PATH names the file (created if missing). BTC_HEADERS_IMPORT
+# optionally names a raw header dump (e.g. from bitcoind) whose new tail is
+# appended at startup; POST /btc/headers appends more as blocks arrive, for
+# whoever holds BTC_HEADERS_TOKEN. Every header is checked against genesis,
+# the retarget rules and its proof of work either way: a header store is
+# only as honest as what it lets in.
+
+# The store and the check itself live in verify_worker.py, which batch
+# verification's worker processes import without dragging the rest of the
+# server (database, writer thread) along.
+
+BTC_HEADERS_PATH = os.getenv('BTC_HEADERS_PATH')
+BTC_HEADERS_IMPORT = os.getenv('BTC_HEADERS_IMPORT')
+BTC_HEADERS_TOKEN = os.getenv('BTC_HEADERS_TOKEN')
+
+header_store: BlockHeaderStore | None = None
+if BTC_HEADERS_PATH:
+    header_store = BlockHeaderStore(BTC_HEADERS_PATH)
+    if BTC_HEADERS_IMPORT:
+        header_store.load_from(BTC_HEADERS_IMPORT)
+    logger.info('Block header store at %s holds %d headers', BTC_HEADERS_PATH, len(header_store))
+else:
+    logger.warning('BTC_HEADERS_PATH not set; Bitcoin attestations are trusted without checking the header')
+
+
 # ── OpenTimestamps helpers ──────────────────────────────────────────────────
 # The previous version of this file imported `from opentimestamps.client import Client`,
 # a class that does not exist anywhere in the opentimestamps package.
@@ -159,16 +808,26 @@ def _ots_create(hash_bytes: bytes) -> bytes:
     point of failure is unacceptable for a todo list that nobody will ever read.
     Each server wraps our hash in a Merkle tree and promises to one day
     convince a Bitcoin miner to care.
+
+    The CALENDAR_K healthiest calendars are tried first; if one fails we move
+    down the ranking, skipping anything whose breaker is open.
     """
     collected = []
-    for url in DEFAULT_AGGREGATORS[:2]:
+    for health in _ranked_calendars():
+        if len(collected) >= CALENDAR_K:
+            break
+        if not health.allow():
+            continue
+        started = time.monotonic()
         try:
-            cal = RemoteCalendar(url)
-            ts = cal.submit(hash_bytes, timeout=8)
+            cal = RemoteCalendar(health.url)
+            ts = cal.submit(hash_bytes, timeout=CALENDAR_TIMEOUT)
+            health.record(True, time.monotonic() - started)
             collected.append(ts)
-            logger.info('Calendar %s accepted our hash without judgment', url)
+            logger.info('Calendar %s accepted our hash without judgment', health.url)
         except Exception as exc:
-            logger.warning('Calendar %s rejected us (%s). Story of our lives.', url, exc)
+            health.record(False, time.monotonic() - started)
+            logger.warning('Calendar %s rejected us (%s). Story of our lives.', health.url, exc)
 
     if not collected:
         raise RuntimeError(
@@ -187,49 +846,530 @@ def _ots_create(hash_bytes: bytes) -> bytes:
     return buf.getvalue()
 
 
-def _ots_upgrade(proof_bytes: bytes) -> bytes:
+def _ots_upgrade(proof_bytes: bytes) -> tuple[bytes, str]:
     """Contact calendars to see if Bitcoin has noticed our existence yet.
 
     Bitcoin does not read todo lists. Bitcoin does not care. Bitcoin is
     busy being mined in a warehouse in Iceland by ASICs that could heat a
     small city. Nevertheless, we ask.
+
+    Returns the upgraded proof and the hex digest it timestamps.
     """
     dctx = StreamDeserializationContext(io.BytesIO(proof_bytes))
     stamp = DetachedTimestampFile.deserialize(dctx)
 
     for msg, attestation in list(stamp.timestamp.all_attestations()):
         if isinstance(attestation, PendingAttestation):
+            if attestation.uri not in CALENDAR_WHITELIST:
+                logger.warning('Ignoring pending attestation from non-whitelisted calendar %r', attestation.uri)
+                continue
+            health = _health_for(attestation.uri)
+            if not health.allow():
+                logger.info('Calendar %s is tripped; deferring this upgrade to a later attempt', attestation.uri)
+                continue
+            started = time.monotonic()
             try:
                 cal = RemoteCalendar(attestation.uri)
-                upgraded_ts = cal.get_timestamp(msg, timeout=8)
+                upgraded_ts = cal.get_timestamp(msg, timeout=CALENDAR_TIMEOUT)
+                health.record(True, time.monotonic() - started)
                 stamp.timestamp.merge(upgraded_ts)
                 logger.info('Calendar %s upgraded our timestamp. Bitcoin is aware.', attestation.uri)
+            except CommitmentNotFoundError as exc:
+                # A prompt "not yet" is the calendar working as intended.
+                health.record(True, time.monotonic() - started)
+                logger.info('Calendar %s still pending (%s). Bitcoin remains indifferent.', attestation.uri, exc)
             except Exception as exc:
+                health.record(False, time.monotonic() - started)
                 logger.warning('Calendar %s still pending (%s). Bitcoin remains indifferent.', attestation.uri, exc)
 
     buf = io.BytesIO()
     stamp.serialize(StreamSerializationContext(buf))
-    return buf.getvalue()
+    return buf.getvalue(), stamp.file_digest.hex()
 
 
-def _ots_verify(proof_bytes: bytes) -> bool:
+def _ots_verify(proof_bytes: bytes, store: BlockHeaderStore | None = None) -> bool:
     """Check whether any attestation in the timestamp has been confirmed by Bitcoin.
 
     Returns True if a miner, somewhere, has unknowingly immortalised a task
     that probably said 'buy oat milk' or 'reply to Dave's email'.
+
+    With a header store, "confirmed" means the digest the proof commits to is
+    the merkle root of the block it names; a height we don't have yet does not
+    verify. Without one we fall back to trusting that the attestation exists.
     """
-    dctx = StreamDeserializationContext(io.BytesIO(proof_bytes))
-    stamp = DetachedTimestampFile.deserialize(dctx)
-    return any(
-        isinstance(att, BitcoinBlockHeaderAttestation)
-        for _, att in stamp.timestamp.all_attestations()
+    return verify_worker.verify(proof_bytes, store if store is not None else header_store)
+
+
+def _ots_verify_quiet(proof_bytes: bytes) -> bool | None:
+    """``_ots_verify`` for batches: a malformed proof is None, not a 500 for everyone."""
+    try:
+        return _ots_verify(proof_bytes)
+    except Exception:
+        return None
+
+
+# ── Batch verification ──────────────────────────────────────────────────────
+# The frontend wants a verdict for every expired task at once. Small batches
+# are checked inline; large ones are fanned out across a process pool, since
+# deserializing proofs is CPU work and the GIL has no interest in todo lists.
+
+BATCH_MAX = int(os.getenv('VERIFY_BATCH_MAX', '1000'))
+BATCH_POOL_MIN = int(os.getenv('VERIFY_BATCH_POOL_MIN', '64'))
+
+_verify_pool: ProcessPoolExecutor | None = None
+_verify_pool_lock = threading.Lock()
+
+
+def _get_verify_pool() -> ProcessPoolExecutor:
+    # Spawned, not forked: by now the writer and archiver threads are running,
+    # and a forked child would inherit whatever locks they (or the header
+    # store) held at that instant. Spawned workers import only verify_worker
+    # and open their own view of the header file.
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=verify_worker.init,
+                initargs=(BTC_HEADERS_PATH,),
+            )
+        return _verify_pool
+
+
+def _ots_verify_many(proofs: list[bytes]) -> list[bool | None]:
+    if len(proofs) < BATCH_POOL_MIN:
+        return [_ots_verify_quiet(p) for p in proofs]
+    pool = _get_verify_pool()
+    chunksize = max(1, len(proofs) // ((os.cpu_count() or 1) * 4))
+    return list(pool.map(verify_worker.verify_quiet, proofs, chunksize=chunksize))
+
+
+def _shutdown_verify_pool():
+    if _verify_pool is not None:
+        _verify_pool.shutdown(cancel_futures=True)
+
+
+# ── Idempotency / single-flight ─────────────────────────────────────────────
+# Double clicks, MCP retries after a timeout and re-anchoring on page reload all
+# submit the same hash again. Identical concurrent requests share one in-flight
+# operation, and completed results are persisted so the next repeat is a lookup.
+
+_inflight_lock = threading.Lock()
+_inflight: dict[str, tuple[str, Future]] = {}
+
+
+def _idem_lookup(key: str, fingerprint: str) -> bytes | None:
+    row = db.execute(
+        'SELECT fingerprint, result FROM idempotency WHERE key = ?', (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    if row[0] != fingerprint:
+        raise HTTPException(
+            status_code=409,
+            detail='Idempotency-Key reused with a different request body',
+        )
+    return row[1]
+
+
+def _idem_store(key: str, fingerprint: str, result: bytes) -> None:
+    writer.submit(lambda cur: cur.execute(
+        'INSERT OR IGNORE INTO idempotency (key, fingerprint, result) VALUES (?, ?, ?)',
+        (key, fingerprint, result),
+    ))
+
+
+def _idem_forget(key: str, result: bytes) -> None:
+    """Drop the stored result for ``key``, unless something else replaced it meanwhile."""
+    writer.submit(lambda cur: cur.execute(
+        'DELETE FROM idempotency WHERE key = ? AND result = ?', (key, result),
+    ))
+
+
+def _idem_age(key: str) -> float | None:
+    """Seconds since the result for ``key`` was stored, or None if there is none."""
+    row = db.execute(
+        "SELECT (julianday('now') - julianday(created)) * 86400 FROM idempotency WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _single_flight(key: str, fingerprint: str, fn) -> bytes:
+    """Run ``fn`` at most once per ``key`` and remember what it returned.
+
+    The first caller for a key becomes the leader and does the work; anyone
+    arriving while it is running waits on the leader's future. Failures are
+    shared with the waiters but never persisted, so the next attempt retries.
+    """
+    cached = _idem_lookup(key, fingerprint)
+    if cached is not None:
+        return cached
+
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        leader = entry is None
+        if leader:
+            fut = Future()
+            _inflight[key] = (fingerprint, fut)
+        else:
+            leader_fingerprint, fut = entry
+    if not leader:
+        if leader_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=409,
+                detail='Idempotency-Key reused with a different request body',
+            )
+        logger.info('Coalescing duplicate request %s onto the one already in flight', key)
+        return fut.result()
+
+    try:
+        # Re-check: a previous leader may have finished between our lookup
+        # and taking the slot.
+        result = _idem_lookup(key, fingerprint)
+        if result is None:
+            result = fn()
+            _idem_store(key, fingerprint, result)
+        fut.set_result(result)
+        return result
+    except BaseException as exc:
+        fut.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _idem_key(scope: str, natural_key: str, idempotency_key: str | None) -> str:
+    """Prefer the client's Idempotency-Key; otherwise dedupe on the request itself."""
+    if idempotency_key:
+        return f'{scope}:key:{idempotency_key}'
+    return f'{scope}:{natural_key}'
+
+
+# ── Proof archive ───────────────────────────────────────────────────────────
+
+EXPORT_BATCH = 500
+
+
+def _record_proof(digest: str, proof_bytes: bytes, user_id: int | None = None) -> None:
+    # A proof stays with its first owner: resubmitting someone else's hash
+    # doesn't move it into your export.
+    writer.submit(lambda cur: cur.execute(
+        'INSERT INTO proofs (hash, user_id, proof) VALUES (?, ?, ?) '
+        'ON CONFLICT(hash) DO UPDATE SET proof = excluded.proof, '
+        'user_id = COALESCE(proofs.user_id, excluded.user_id), updated = CURRENT_TIMESTAMP',
+        (digest, user_id, proof_bytes),
+    ))
+
+
+def _iter_proofs(user_id: int | None, since: str | None, until: str | None):
+    """Yield ``(hash, proof, created)`` rows a batch at a time.
+
+    Uses its own connection so a 100k-proof export neither holds the shared
+    one hostage nor ever has more than EXPORT_BATCH proofs in memory.
+    """
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(user_id)
+    if since:
+        clauses.append('created >= ?')
+        params.append(since)
+    if until:
+        clauses.append('created < ?')
+        params.append(until)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    # Starlette pulls each chunk from a worker thread, not necessarily the same one.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    try:
+        cur = conn.execute(f'SELECT hash, proof, created FROM proofs{where} ORDER BY created, hash', params)
+        while rows := cur.fetchmany(EXPORT_BATCH):
+            yield from rows
+    finally:
+        conn.close()
+
+
+def _export_stream(rows):
+    """Length-prefixed records: 32-byte digest, uint32 big-endian length, proof."""
+    for digest, proof, _ in rows:
+        yield bytes.fromhex(digest) + struct.pack('>I', len(proof)) + proof
+
+
+class _ChunkSink:
+    """Write-only file object that hands tarfile's output back to a generator."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _export_tar(rows):
+    """A streaming tarball of ``<hash>.ots`` files, one proof per member."""
+    sink = _ChunkSink()
+    with tarfile.open(fileobj=sink, mode='w|') as tar:
+        for digest, proof, created in rows:
+            info = tarfile.TarInfo(f'{digest}.ots')
+            info.size = len(proof)
+            try:
+                info.mtime = int(time.mktime(time.strptime(created, '%Y-%m-%d %H:%M:%S')))
+            except (TypeError, ValueError):
+                info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(proof))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ── Archival ────────────────────────────────────────────────────────────────
+# Todos that have been done for ARCHIVE_AFTER_DAYS move to todos_archive, in
+# batches, on a background thread. Afterwards up to VACUUM_PAGES free pages
+# are released. Archived todos are only returned when a caller asks for them
+# with include_archived.
+
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH = 1000
+VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', '2000'))
+
+_archive_stop = threading.Event()
+
+
+def _archive_batch(cur: sqlite3.Cursor, age: str, tombstone_cutoff: int) -> int | None:
+    """Archive up to ARCHIVE_BATCH rows; returns how many were live, or None when done.
+
+    Runs inside the writer, so no /sync or completion can land between picking
+    the rows and moving them.
+    """
+    rows = cur.execute(
+        "SELECT id, user_id, seq, deleted FROM todos WHERE "
+        "(deleted = 0 AND done = 1 AND COALESCE(completed, created) < datetime('now', ?)) "
+        "OR (deleted = 1 AND COALESCE(updated_at, 0) < ?) LIMIT ?",
+        (age, tombstone_cutoff, ARCHIVE_BATCH),
+    ).fetchall()
+    if not rows:
+        return None
+    ids = [row[0] for row in rows]
+    live = [row[0] for row in rows if not row[3]]
+    if live:
+        cur.execute(
+            'INSERT OR REPLACE INTO todos_archive '
+            '(id, user_id, text, done, created, completed, client_id, data, updated_at) '
+            'SELECT id, user_id, text, done, created, completed, client_id, data, updated_at FROM todos '
+            f"WHERE id IN ({','.join('?' * len(live))})",
+            live,
+        )
+    cur.execute(f"DELETE FROM todos WHERE id IN ({','.join('?' * len(ids))})", ids)
+    floors: dict[int, int] = {}
+    for _, user_id, seq, _ in rows:
+        floors[user_id] = max(floors.get(user_id, 0), seq or 0)
+    cur.executemany(
+        'UPDATE sync_state SET floor = MAX(floor, ?) WHERE user_id = ?',
+        [(seq, user_id) for user_id, seq in floors.items()],
     )
+    return len(live)
+
+
+def _archive_done_todos(conn: sqlite3.Connection) -> int:
+    """Move one sweep's worth of old done todos to the archive; returns how many.
+
+    Sync tombstones of the same age are purged in the same pass. Either way the
+    user's sync floor is raised past the removed rows, so clients that last
+    synced before them get a full snapshot instead of a silently partial delta.
+    Batches go through the writer; ``conn`` only gives back free pages.
+    """
+    age = f'-{ARCHIVE_AFTER_DAYS} days'
+    tombstone_cutoff = _now_ms() - int(ARCHIVE_AFTER_DAYS * 86_400_000)
+    moved = 0
+    while (live := writer.submit(lambda cur: _archive_batch(cur, age, tombstone_cutoff))) is not None:
+        moved += live
+    if conn.execute('PRAGMA freelist_count').fetchone()[0]:
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+    return moved
+
+
+def _archive_loop() -> None:
+    # Its own connection for vacuuming, so a long one doesn't hold the
+    # shared one hostage.
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        while not _archive_stop.is_set():
+            try:
+                moved = _archive_done_todos(conn)
+                if moved:
+                    logger.info('Archived %d completed todos. Out of sight, out of mind.', moved)
+            except Exception:
+                logger.exception('Archival sweep failed; will try again next interval')
+            _archive_stop.wait(ARCHIVE_INTERVAL)
+    finally:
+        conn.close()
+
+
+def _start_archiver():
+    if ARCHIVE_INTERVAL > 0:
+        threading.Thread(target=_archive_loop, name='archiver', daemon=True).start()
+
+
+# ── Delta sync ──────────────────────────────────────────────────────────────
+# The frontend keeps its tasks in localStorage; the todos table is what the MCP
+# server sees. /sync keeps the two in step at a cost proportional to what
+# changed: every mutation stamps the row with the user's next sequence
+# number, a client sends what it changed since its last sync and gets back
+# every row with a higher seq than it has seen.
+#
+# Conflicts (both sides changed the same task since the client's last sync)
+# are settled by comparing (updated_at, deleted, data) — latest edit wins,
+# a delete beats an edit made in the same millisecond, then the larger JSON,
+# then the server. Every replica that sees the same two versions picks the same one.
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _bump_seq(cur: sqlite3.Cursor, user_id: int) -> int:
+    cur.execute('INSERT OR IGNORE INTO sync_state (user_id) VALUES (?)', (user_id,))
+    cur.execute('UPDATE sync_state SET seq = seq + 1 WHERE user_id = ?', (user_id,))
+    return cur.execute('SELECT seq FROM sync_state WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def _sync_row(row) -> dict:
+    id_, client_id, text, done, created, data, deleted, updated_at, seq = row
+    return {
+        'id': id_,
+        'client_id': client_id,
+        'seq': seq,
+        'deleted': bool(deleted),
+        'updated_at': updated_at,
+        'text': text,
+        'done': bool(done),
+        'created': created,
+        'data': json.loads(data) if data else None,
+    }
+
+
+def _apply_archived_change(cur: sqlite3.Cursor, cold: tuple, change, updated_at: int, data_json: str | None):
+    """Fold a change to an archived task into the archive.
+
+    Deletions and edits that leave the task done stay in cold storage (and
+    return None). An edit that un-completes it moves the row back to ``todos``
+    under its original id and returns it as a hot row for the caller to update.
+    """
+    archive_id, cold_updated_at, cold_data = cold
+    if change.deleted:
+        cur.execute('DELETE FROM todos_archive WHERE id = ?', (archive_id,))
+        return None
+    if data_json == cold_data or updated_at <= (cold_updated_at or 0):
+        return None  # the copy we archived, or an older one
+    data = change.data or {}
+    if data.get('completed'):
+        cur.execute(
+            'UPDATE todos_archive SET text = ?, data = ?, updated_at = ? WHERE id = ?',
+            (data.get('title', ''), data_json, updated_at, archive_id),
+        )
+        return None
+    cur.execute(
+        'INSERT INTO todos (id, user_id, client_id, text, done, created, completed, data, deleted, updated_at, seq) '
+        'SELECT id, user_id, client_id, text, done, created, completed, data, 0, updated_at, 0 '
+        'FROM todos_archive WHERE id = ?',
+        (archive_id,),
+    )
+    cur.execute('DELETE FROM todos_archive WHERE id = ?', (archive_id,))
+    return (archive_id, 0, cold_updated_at, 0, cold_data)
+
+
+def _apply_sync(cur: sqlite3.Cursor, user_id: int, since: int, changes: list) -> dict:
+    """Apply a client's changes and collect the server's; runs inside the writer."""
+    state = cur.execute('SELECT seq, floor FROM sync_state WHERE user_id = ?', (user_id,)).fetchone()
+    current, floor = state if state else (0, 0)
+    # Behind the archive, or ahead of anything we have handed out (the
+    # database was restored or recreated): either way a delta would be wrong.
+    reset = since > 0 and (since < floor or since > current)
+    if reset:
+        since = 0
+
+    applied: set[int] = set()
+    seq = None
+    now = _now_ms()
+    for change in changes:
+        # A client clock from the future doesn't get to win every conflict.
+        updated_at = min(change.updated_at, now)
+        data_json = json.dumps(change.data, sort_keys=True, separators=(',', ':')) if change.data is not None else None
+        row = cur.execute(
+            'SELECT id, seq, updated_at, deleted, data FROM todos WHERE user_id = ? AND client_id = ?',
+            (user_id, change.client_id),
+        ).fetchone()
+        if row is None:
+            # Browsers keep tasks long after we archive them, and push them all
+            # again after a reset. Match those against the archive rather than
+            # minting a second row for the same client_id.
+            cold = cur.execute(
+                'SELECT id, updated_at, data FROM todos_archive WHERE user_id = ? AND client_id = ?',
+                (user_id, change.client_id),
+            ).fetchone()
+            if cold is not None:
+                row = _apply_archived_change(cur, cold, change, updated_at, data_json)
+                if row is None:
+                    continue
+        if row is None and change.deleted:
+            continue  # never heard of it; nothing to delete
+        if row is not None and row[1] > since:
+            ours = (row[2] or 0, row[3] or 0, row[4] or '')
+            theirs = (updated_at, int(change.deleted), data_json or '')
+            if theirs <= ours:
+                continue  # server copy wins and is returned below
+        if seq is None:
+            seq = _bump_seq(cur, user_id)
+        data = change.data or {}
+        done = int(bool(data.get('completed')))
+        if row is None:
+            cur.execute(
+                'INSERT INTO todos (user_id, client_id, text, done, completed, data, deleted, updated_at, seq) '
+                'VALUES (?, ?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END, ?, 0, ?, ?)',
+                (user_id, change.client_id, data.get('title', ''), done, done, data_json, updated_at, seq),
+            )
+            applied.add(cur.lastrowid)
+        elif change.deleted:
+            cur.execute(
+                'UPDATE todos SET deleted = 1, updated_at = ?, seq = ? WHERE id = ?',
+                (updated_at, seq, row[0]),
+            )
+            applied.add(row[0])
+        else:
+            cur.execute(
+                'UPDATE todos SET text = ?, '
+                'completed = CASE WHEN ? AND done = 0 THEN CURRENT_TIMESTAMP WHEN ? THEN completed END, '
+                'done = ?, data = ?, deleted = 0, updated_at = ?, seq = ? WHERE id = ?',
+                (data.get('title', ''), done, done, done, data_json, updated_at, seq, row[0]),
+            )
+            applied.add(row[0])
+
+    rows = cur.execute(
+        'SELECT id, client_id, text, done, created, data, deleted, updated_at, seq '
+        'FROM todos WHERE user_id = ? AND seq > ? ORDER BY seq',
+        (user_id, since),
+    ).fetchall()
+    latest = cur.execute('SELECT seq FROM sync_state WHERE user_id = ?', (user_id,)).fetchone()
+    return {
+        'seq': latest[0] if latest else 0,
+        'reset': reset,
+        # Rows the client just sent us are left out; it already has them.
+        'changes': [_sync_row(r) for r in rows if r[0] not in applied or reset],
+    }
 
 
 # ── Request models ──────────────────────────────────────────────────────────
 
 class HashReq(BaseModel):
     hash: str
+    # Optional owner, so the proof shows up in that user's /ots/export.
+    user_id: int | None = None
 
 class VerifyReq(BaseModel):
     hash: str
@@ -253,6 +1393,12 @@ class AnchorReq(BaseModel):
 class AnchorVerifyReq(BaseModel):
     hash: str
 
+class VerifyBatchReq(BaseModel):
+    items: list[VerifyReq]
+
+class AnchorVerifyBatchReq(BaseModel):
+    hashes: list[str]
+
 class UserReq(BaseModel):
     username: str
     password: str
@@ -261,6 +1407,20 @@ class TodoReq(BaseModel):
     user_id: int
     text: str
 
+class SyncChange(BaseModel):
+    client_id: str
+    # The frontend's task object; None for deletions.
+    data: dict | None = None
+    deleted: bool = False
+    # When the client made the change (ms since epoch); decides conflicts.
+    updated_at: int
+
+class SyncReq(BaseModel):
+    user_id: int
+    # The seq returned by the client's previous /sync; 0 for a first sync.
+    since: int = 0
+    changes: list[SyncChange] = []
+
 
 # ── Routes ──────────────────────────────────────────────────────────────────
 
@@ -270,11 +1430,16 @@ def root():
 
 
 @app.post('/ots/create')
-def create(req: HashReq):
+def create(req: HashReq, idempotency_key: str | None = Header(None)):
     logger.info('OTS create for %s', req.hash)
+    digest = req.hash.lower().removeprefix('0x')
+    key = _idem_key('ots:create', digest, idempotency_key)
     try:
-        proof_bytes = _ots_create(bytes.fromhex(req.hash))
+        proof_bytes = _single_flight(key, digest, lambda: _ots_create(bytes.fromhex(digest)))
+        _record_proof(digest, proof_bytes, req.user_id)
         return {'proof': base64.b64encode(proof_bytes).decode()}
+    except HTTPException:
+        raise
     except Exception:
         logger.exception('OTS create failed')
         raise HTTPException(status_code=500, detail='OTS create failed; the calendars have spoken')
@@ -292,20 +1457,176 @@ def verify(req: VerifyReq):
         raise HTTPException(status_code=500, detail='OTS verify failed; Bitcoin shrugged')
 
 
+@app.post('/ots/verify/batch')
+def verify_batch(req: VerifyBatchReq, request: Request):
+    """Verify many proofs in one request; returns ``{"results": {hash: {...}}}``."""
+    logger.info('OTS batch verify for %d proofs', len(req.items))
+    if len(req.items) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f'batch too large (max {BATCH_MAX})')
+    results: dict[str, dict] = {}
+    proofs: list[bytes] = []
+    hashes: list[str] = []
+    for item in req.items:
+        try:
+            proofs.append(base64.b64decode(item.proof, validate=True))
+            hashes.append(item.hash)
+        except ValueError:
+            results[item.hash] = {'verified': False, 'error': 'proof is not valid base64'}
+    try:
+        verdicts = _ots_verify_many(proofs)
+    except Exception:
+        logger.exception('OTS batch verify failed')
+        raise HTTPException(status_code=500, detail='OTS verify failed; Bitcoin shrugged')
+    for digest, ok in zip(hashes, verdicts):
+        results[digest] = {'verified': bool(ok)} if ok is not None else {'verified': False, 'error': 'malformed proof'}
+    return _render(request, {'results': results})
+
+
 @app.post('/ots/upgrade')
 def upgrade(req: UpgradeReq):
     logger.info('OTS upgrade request')
     try:
         proof_bytes = base64.b64decode(req.proof)
-        upgraded = _ots_upgrade(proof_bytes)
+        upgraded, digest = _ots_upgrade(proof_bytes)
+        _record_proof(digest, upgraded)
         return {'proof': base64.b64encode(upgraded).decode()}
     except Exception:
         logger.exception('OTS upgrade failed')
         raise HTTPException(status_code=500, detail='OTS upgrade failed; try again in an eon')
 
 
+# Binary twins of the OTS routes. Proofs go in and out as raw bytes, skipping
+# the base64 tax (about a third of every payload) and the encode/decode work.
+
+@app.post('/ots/create/raw')
+async def create_raw(
+    request: Request,
+    user_id: int | None = None,
+    idempotency_key: str | None = Header(None),
+):
+    body = await request.body()
+    if len(body) != 32:
+        raise HTTPException(status_code=400, detail='expected a raw 32-byte SHA-256 digest')
+    digest = body.hex()
+    logger.info('OTS create (raw) for %s', digest)
+    key = _idem_key('ots:create', digest, idempotency_key)
+
+    def work() -> bytes:
+        proof_bytes = _single_flight(key, digest, lambda: _ots_create(body))
+        _record_proof(digest, proof_bytes, user_id)
+        return proof_bytes
+
+    try:
+        proof_bytes = await run_in_threadpool(work)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('OTS create failed')
+        raise HTTPException(status_code=500, detail='OTS create failed; the calendars have spoken')
+    return Response(proof_bytes, media_type='application/octet-stream')
+
+
+@app.post('/ots/verify/raw')
+async def verify_raw(request: Request):
+    proof_bytes = await request.body()
+    logger.info('OTS verify (raw) for %d-byte proof', len(proof_bytes))
+    try:
+        ok = await run_in_threadpool(_ots_verify, proof_bytes)
+        return {'verified': ok}
+    except Exception:
+        logger.exception('OTS verify failed')
+        raise HTTPException(status_code=500, detail='OTS verify failed; Bitcoin shrugged')
+
+
+@app.post('/ots/upgrade/raw')
+async def upgrade_raw(request: Request):
+    proof_bytes = await request.body()
+    logger.info('OTS upgrade (raw) request')
+
+    def work() -> bytes:
+        upgraded, digest = _ots_upgrade(proof_bytes)
+        _record_proof(digest, upgraded)
+        return upgraded
+
+    try:
+        upgraded = await run_in_threadpool(work)
+    except Exception:
+        logger.exception('OTS upgrade failed')
+        raise HTTPException(status_code=500, detail='OTS upgrade failed; try again in an eon')
+    return Response(upgraded, media_type='application/octet-stream')
+
+
+@app.get('/ots/export')
+def export_proofs(
+    user_id: int | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    format: str = 'tar',
+):
+    """Stream every stored proof (optionally for one user and/or date range).
+
+    ``format=tar`` yields ``<hash>.ots`` members; ``format=stream`` yields
+    length-prefixed records. Either way, rows are read and written a batch at
+    a time, so archiving 100k proofs costs one download and not much RAM.
+    """
+    if format not in ('tar', 'stream'):
+        raise HTTPException(status_code=400, detail="format must be 'tar' or 'stream'")
+    logger.info('OTS export user=%s since=%s until=%s format=%s', user_id, since, until, format)
+    rows = _iter_proofs(user_id, since, until)
+    if format == 'tar':
+        return StreamingResponse(
+            _export_tar(rows),
+            media_type='application/x-tar',
+            headers={'Content-Disposition': 'attachment; filename="proofs.tar"'},
+        )
+    return StreamingResponse(
+        _export_stream(rows),
+        media_type='application/octet-stream',
+        headers={'Content-Disposition': 'attachment; filename="proofs.bin"'},
+    )
+
+
+@app.post('/btc/headers')
+async def append_headers(request: Request, authorization: str | None = Header(None)):
+    """Append raw 80-byte headers onto the local store's tip; returns the new height."""
+    if not BTC_HEADERS_TOKEN:
+        raise HTTPException(status_code=403, detail='BTC_HEADERS_TOKEN not set; headers come from BTC_HEADERS_IMPORT only')
+    if not hmac.compare_digest(authorization or '', f'Bearer {BTC_HEADERS_TOKEN}'):
+        raise HTTPException(status_code=401, detail='operator token required')
+    if header_store is None:
+        raise HTTPException(status_code=503, detail='BTC_HEADERS_PATH not set; no header store to append to')
+    body = await request.body()
+    try:
+        count = await run_in_threadpool(header_store.append, body)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    logger.info('Header store now holds %d headers', count)
+    return {'headers': count, 'tip_height': count - 1}
+
+
+# A broadcast tx can still vanish: underpriced and evicted from the mempool,
+# or replaced by another anchor that raced it for the same nonce. A stored tx
+# hash older than this that the node has never heard of is forgotten, and the
+# anchor is sent again.
+ANCHOR_DROP_SECONDS = float(os.getenv('EVM_ANCHOR_DROP_SECONDS', '600'))
+
+
+def _anchor_dropped(w3: Web3, key: str, tx: str) -> bool:
+    age = _idem_age(key)
+    if age is None or age < ANCHOR_DROP_SECONDS:
+        return False
+    try:
+        w3.eth.get_transaction(tx)
+    except TransactionNotFound:
+        return True
+    except Exception:
+        # Node trouble isn't evidence of anything; keep the tx we paid for.
+        logger.warning('Could not look up anchor tx %s; keeping it', tx)
+    return False
+
+
 @app.post('/evm/anchor')
-def anchor(req: AnchorReq):
+def anchor(req: AnchorReq, idempotency_key: str | None = Header(None)):
     logger.info('EVM anchor for %s', req.hash)
 
     # Accept per-request credentials so each user can bring their own wallet.
@@ -326,10 +1647,10 @@ def anchor(req: AnchorReq):
 
     # Build a one-off web3 client from effective credentials.
     w3 = Web3(Web3.HTTPProvider(effective_rpc))
-    acct = w3.eth.account.from_key(effective_key)
-    ctract = w3.eth.contract(address=effective_contract, abi=ABI)
 
-    try:
+    def send() -> bytes:
+        acct = w3.eth.account.from_key(effective_key)
+        ctract = w3.eth.contract(address=effective_contract, abi=ABI)
         nonce = w3.eth.get_transaction_count(acct.address)
         func = ctract.functions.store if effective_mode != 'lite' else ctract.functions.record
         txn = func(Web3.to_bytes(hexstr=req.hash), req.ref).build_transaction(
@@ -342,19 +1663,55 @@ def anchor(req: AnchorReq):
         )
         signed = acct.sign_transaction(txn)
         tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-        w3.eth.wait_for_transaction_receipt(tx_hash)
-        explorer_link = f"{effective_explorer}/tx/{tx_hash.hex()}" if effective_explorer else ''
-        logger.info('Anchored %s in tx %s — a miner has witnessed your procrastination', req.hash, tx_hash.hex())
-        return {
-            'tx': tx_hash.hex(),
-            'contract': effective_contract,
-            'chain': effective_chain,
-            'explorer': explorer_link,
-        }
+        # Broadcast means paid for. Hand the hash back now so it is persisted
+        # before we start waiting on a receipt that may never come in time.
+        logger.info('Sent anchor for %s in tx %s', req.hash, tx_hash.hex())
+        return tx_hash.hex().encode()
+
+    # The same hash on the same contract in the same mode is the same anchor;
+    # paying for it twice only makes the miner happier.
+    digest = req.hash.lower().removeprefix('0x')
+    natural = f'{effective_contract.lower()}:{effective_mode}:{digest}'
+    key = _idem_key('evm:anchor', natural, idempotency_key)
+    try:
+        tx = _single_flight(key, natural, send).decode()
+        if _anchor_dropped(w3, key, tx):
+            # Forgotten only if it is still the stored tx: a concurrent retry
+            # may already have resent, and we'd rather share its tx than pay again.
+            logger.warning('Anchor tx %s for %s was dropped by the network; resending', tx, req.hash)
+            _idem_forget(key, tx.encode())
+            tx = _single_flight(key, natural, send).decode()
+    except HTTPException:
+        raise
     except Exception:
         logger.exception('EVM anchor failed')
         raise HTTPException(status_code=500, detail='EVM anchor failed; the chain remains pure')
 
+    # Waiting is a separate step: a timeout here leaves the stored tx hash in
+    # place, so a retry waits on the same tx instead of paying for another.
+    try:
+        receipt = w3.eth.wait_for_transaction_receipt(bytes.fromhex(tx.removeprefix('0x')))
+    except Exception:
+        logger.warning('No receipt yet for anchor tx %s; reporting it as pending', tx)
+        status = 'pending'
+    else:
+        if receipt['status'] == 1:
+            status = 'confirmed'
+            logger.info('Anchored %s in tx %s — a miner has witnessed your procrastination', req.hash, tx)
+        else:
+            # A reverted tx anchored nothing; forget it so the next attempt resends.
+            status = 'reverted'
+            _idem_forget(key, tx.encode())
+            logger.warning('Anchor tx %s for %s reverted', tx, req.hash)
+    explorer_link = f"{effective_explorer}/tx/{tx}" if effective_explorer else ''
+    return {
+        'tx': tx,
+        'status': status,
+        'contract': effective_contract,
+        'chain': effective_chain,
+        'explorer': explorer_link,
+    }
+
 
 @app.post('/evm/verify')
 def verify_anchor(req: AnchorVerifyReq):
@@ -363,9 +1720,7 @@ def verify_anchor(req: AnchorVerifyReq):
         raise HTTPException(status_code=500, detail='EVM not configured')
     try:
         event = contract.events.Stored if EVM_MODE != 'lite' else contract.events.Recorded
-        logs = event.create_filter(
-            fromBlock=0, argument_filters={'hash': Web3.to_bytes(hexstr=req.hash)}
-        ).get_all_entries()
+        logs = event.get_logs(from_block=0, argument_filters={'hash': Web3.to_bytes(hexstr=req.hash)})
         if logs:
             tx_hash = logs[-1]['transactionHash'].hex()
             return {'found': True, 'tx': tx_hash}
@@ -375,17 +1730,57 @@ def verify_anchor(req: AnchorVerifyReq):
         raise HTTPException(status_code=500, detail='EVM verify failed')
 
 
+@app.post('/evm/verify/batch')
+def verify_anchor_batch(req: AnchorVerifyBatchReq, request: Request):
+    """Resolve many hashes with one log query instead of one filter per hash.
+
+    The event's ``hash`` argument isn't indexed, so the node can't filter on it
+    for us anyway: fetch the contract's logs once and match them locally.
+    """
+    logger.info('EVM batch verify for %d hashes', len(req.hashes))
+    if not contract:
+        raise HTTPException(status_code=500, detail='EVM not configured')
+    if len(req.hashes) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f'batch too large (max {BATCH_MAX})')
+    wanted: dict[bytes, list[str]] = {}
+    for h in req.hashes:
+        try:
+            wanted.setdefault(Web3.to_bytes(hexstr=h), []).append(h)
+        except ValueError:
+            continue
+    try:
+        event = contract.events.Stored if EVM_MODE != 'lite' else contract.events.Recorded
+        logs = event.get_logs(from_block=0)
+    except Exception:
+        logger.exception('EVM batch verify failed')
+        raise HTTPException(status_code=500, detail='EVM verify failed')
+    # Later logs overwrite earlier ones, matching /evm/verify's logs[-1].
+    latest: dict[bytes, str] = {}
+    for log in logs:
+        digest = bytes(log['args']['hash'])
+        if digest in wanted:
+            latest[digest] = log['transactionHash'].hex()
+    results: dict[str, dict] = {h: {'found': False} for h in req.hashes}
+    for digest, originals in wanted.items():
+        if digest in latest:
+            for h in originals:
+                results[h] = {'found': True, 'tx': latest[digest]}
+    return _render(request, {'results': results})
+
+
 @app.post('/users/register')
 def register(user: UserReq):  # noqa: F811
     # We hash passwords with SHA-256. This is infinitely better than plaintext
     # and approximately infinitely worse than bcrypt/argon2. Progress is a spectrum.
     # If you're reading this in a security audit: hi, sorry, this is satire.
     hashed = hashlib.sha256(user.password.encode()).hexdigest()
-    cur = db.cursor()
-    try:
+
+    def insert(cur):
         cur.execute('INSERT INTO users (username, password) VALUES (?, ?)', (user.username, hashed))
-        db.commit()
-        return {'id': cur.lastrowid}
+        return cur.lastrowid
+
+    try:
+        return {'id': writer.submit(insert)}
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail='username taken')
 
@@ -403,44 +1798,89 @@ def login(user: UserReq):
 
 @app.post('/todos/add')
 def add_todo(todo: TodoReq):
-    cur = db.cursor()
-    cur.execute('INSERT INTO todos (user_id, text) VALUES (?, ?)', (todo.user_id, todo.text))
-    db.commit()
-    return {'id': cur.lastrowid}
+    def insert(cur):
+        seq = _bump_seq(cur, todo.user_id)
+        cur.execute(
+            'INSERT INTO todos (user_id, text, seq, updated_at) VALUES (?, ?, ?, ?)',
+            (todo.user_id, todo.text, seq, _now_ms()),
+        )
+        cur.execute("UPDATE todos SET client_id = 'srv-' || id WHERE id = ?", (cur.lastrowid,))
+        return cur.lastrowid
+
+    return {'id': writer.submit(insert)}
 
 
 @app.get('/todos/{user_id}')
-def list_todos(user_id: int):
-    cur = db.cursor()
-    cur.execute('SELECT id, text, done, created FROM todos WHERE user_id = ?', (user_id,))
-    rows = cur.fetchall()
+def list_todos(user_id: int, request: Request, include_archived: bool = False):
+    cur = db.execute('SELECT id, text, done, created FROM todos WHERE user_id = ? AND deleted = 0', (user_id,))
     todos = [
-        {'id': r[0], 'text': r[1], 'done': bool(r[2]), 'created': r[3]}
-        for r in rows
+        {'id': id_, 'text': text, 'done': bool(done), 'created': created}
+        for id_, text, done, created in cur
     ]
-    return {'todos': todos}
+    if include_archived:
+        for t in todos:
+            t['archived'] = False
+        cur = db.execute(
+            'SELECT id, text, done, created FROM todos_archive WHERE user_id = ? ORDER BY id', (user_id,)
+        )
+        todos += [
+            {'id': id_, 'text': text, 'done': bool(done), 'created': created, 'archived': True}
+            for id_, text, done, created in cur
+        ]
+    return _render(request, {'todos': todos})
 
 
 @app.put('/todos/{task_id}/done')
 def complete_todo(task_id: int):
-    cur = db.cursor()
-    cur.execute('UPDATE todos SET done = 1 WHERE id = ?', (task_id,))
-    if cur.rowcount == 0:
-        raise HTTPException(status_code=404, detail='task not found')
-    db.commit()
+    def update(cur):
+        row = cur.execute('SELECT user_id FROM todos WHERE id = ? AND deleted = 0', (task_id,)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail='task not found')
+        cur.execute(
+            'UPDATE todos SET done = 1, completed = CURRENT_TIMESTAMP, '
+            "data = CASE WHEN data IS NULL THEN NULL ELSE json_set(data, '$.completed', json('true')) END, "
+            'seq = ?, updated_at = ? WHERE id = ?',
+            (_bump_seq(cur, row[0]), _now_ms(), task_id),
+        )
+
+    writer.submit(update)
     return {'ok': True, 'task_id': task_id}
 
 
 @app.delete('/todos/{task_id}')
 def delete_todo(task_id: int):
-    cur = db.cursor()
-    cur.execute('DELETE FROM todos WHERE id = ?', (task_id,))
-    if cur.rowcount == 0:
-        raise HTTPException(status_code=404, detail='task not found')
-    db.commit()
+    def delete(cur):
+        # Live rows become tombstones so other devices hear about the delete
+        # on their next /sync; the archiver purges them once they're old.
+        row = cur.execute('SELECT user_id FROM todos WHERE id = ? AND deleted = 0', (task_id,)).fetchone()
+        if row is not None:
+            cur.execute(
+                'UPDATE todos SET deleted = 1, seq = ?, updated_at = ? WHERE id = ?',
+                (_bump_seq(cur, row[0]), _now_ms(), task_id),
+            )
+            return
+        cur.execute('DELETE FROM todos_archive WHERE id = ?', (task_id,))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=404, detail='task not found')
+
+    writer.submit(delete)
     return {'ok': True, 'task_id': task_id}
 
 
+@app.post('/sync')
+def sync(req: SyncReq, request: Request):
+    """Exchange task changes with a client since its last sync.
+
+    Returns ``{"seq", "reset", "changes"}``. Store ``seq`` and send it back as
+    ``since`` next time. ``reset`` means the client's ``since`` is behind the
+    archive or ahead of the server, and ``changes`` holds a full snapshot
+    instead of a delta.
+    """
+    logger.info('Sync for user %s since %s with %d changes', req.user_id, req.since, len(req.changes))
+    payload = writer.submit(lambda cur: _apply_sync(cur, req.user_id, req.since, req.changes))
+    return _render(request, payload)
+
+
 @app.get('/health')
 def health():
     """Health check endpoint for load balancers that will never exist.
@@ -460,6 +1900,8 @@ def health():
         'uptime_seconds': round(time.time() - START_TIME, 1),
         'database': f'sqlite — {db_status} — enterprise-grade if you squint',
         'blockchain': 'optional (EVM_RPC_URL not set)' if not RPC_URL else f'wired to {CHAIN_NAME}',
+        'calendars': {h.url: h.snapshot() for h in _ranked_calendars()},
+        'bitcoin_headers': 'unchecked (BTC_HEADERS_PATH not set)' if header_store is None else len(header_store),
         'quantum_rng': 'delegated to frontend (not our problem)',
         'haiku_quality': 'variable (depends on OpenAI mood)',
         'password_security': 'sha256 (we know, we know)',
@@ -469,7 +1911,7 @@ def health():
 
 
 @app.get('/metrics')
-def metrics():
+def metrics(request: Request):
     """Prometheus-format metrics for dashboards nobody will build.
 
     Copy this output into a Grafana panel and watch your team nod seriously
@@ -477,28 +1919,41 @@ def metrics():
     The existential_dread metric is always 9.7. We measured.
     """
     cur = db.cursor()
-    cur.execute('SELECT COUNT(*) FROM todos')
+    cur.execute('SELECT COUNT(*) FROM todos WHERE deleted = 0')
     todo_count = cur.fetchone()[0]
-    cur.execute('SELECT COUNT(*) FROM todos WHERE done = 1')
+    cur.execute('SELECT COUNT(*) FROM todos WHERE done = 1 AND deleted = 0')
     done_count = cur.fetchone()[0]
     cur.execute('SELECT COUNT(*) FROM users')
     user_count = cur.fetchone()[0]
+    cur.execute('SELECT COUNT(*) FROM todos_archive')
+    archived_count = cur.fetchone()[0]
 
     uptime = round(time.time() - START_TIME, 1)
 
-    return PlainTextResponse(
-        f"""# HELP qtodo_todos_total Total todo items languishing in the database
+    body = f"""# HELP qtodo_todos_total Total todo items languishing in the database
 # TYPE qtodo_todos_total gauge
 qtodo_todos_total {todo_count}
 # HELP qtodo_todos_done_total Tasks heroically completed (server-side; localStorage not counted)
 # TYPE qtodo_todos_done_total gauge
 qtodo_todos_done_total {done_count}
+# HELP qtodo_todos_archived_total Completed tasks moved to cold storage (out of sight, out of mind)
+# TYPE qtodo_todos_archived_total gauge
+qtodo_todos_archived_total {archived_count}
 # HELP qtodo_users_total Users who trusted us with their passwords (hashed with SHA-256, sorry)
 # TYPE qtodo_users_total gauge
 qtodo_users_total {user_count}
 # HELP qtodo_uptime_seconds Seconds the server has been running without exploding
 # TYPE qtodo_uptime_seconds counter
 qtodo_uptime_seconds {uptime}
+# HELP qtodo_group_commit_batches_total Write transactions committed by the group-commit writer
+# TYPE qtodo_group_commit_batches_total counter
+qtodo_group_commit_batches_total {writer.batches}
+# HELP qtodo_group_commit_ops_total Mutations folded into those transactions (ops / batches = fsyncs saved, roughly)
+# TYPE qtodo_group_commit_ops_total counter
+qtodo_group_commit_ops_total {writer.ops}
+# HELP qtodo_btc_headers Bitcoin block headers in the local store (0 means attestations are taken on faith)
+# TYPE qtodo_btc_headers gauge
+qtodo_btc_headers {len(header_store) if header_store is not None else 0}
 # HELP qtodo_blockchain_anchors_total Tasks anchored on-chain (immutable, permanent, pointless)
 # TYPE qtodo_blockchain_anchors_total counter
 qtodo_blockchain_anchors_total 0
@@ -511,9 +1966,8 @@ qtodo_features_added_for_features_sake 14
 # HELP qtodo_lines_of_code_per_checkbox Lines of code required to render a checkbox
 # TYPE qtodo_lines_of_code_per_checkbox gauge
 qtodo_lines_of_code_per_checkbox 847
-""",
-        media_type='text/plain; version=0.0.4; charset=utf-8',
-    )
+""" + _calendar_metrics() + _admission_metrics()
+    return _compressed(request, body.encode(), 'text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.websocket('/ws')
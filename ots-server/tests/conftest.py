@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# main.py opens its database and starts its background threads at import time,
+# so point it at a scratch file and keep the archiver asleep before anyone
+# imports it.
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(prefix='qtodo-test-'), 'todo.db'))
+os.environ.setdefault('ARCHIVE_INTERVAL_SECONDS', '0')
+os.environ.setdefault('RATE_LIMIT_RPS', '0')
+os.environ.pop('BTC_HEADERS_PATH', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
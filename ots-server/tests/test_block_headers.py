@@ -0,0 +1,181 @@
+"""Attestation checking against a fixture header store. No network, no Bitcoin node,
+just a handful of made-up blocks that link up the way real ones do."""
+import hashlib
+import io
+
+import pytest
+from opentimestamps.core.notary import BitcoinBlockHeaderAttestation
+from opentimestamps.core.op import OpSHA256
+from opentimestamps.core.serialize import StreamSerializationContext
+from opentimestamps.core.timestamp import DetachedTimestampFile, Timestamp
+
+import main
+import verify_worker
+
+# Regtest's proof-of-work limit: about every other nonce meets it.
+EASY_BITS = 0x207FFFFF
+EASY_LIMIT = verify_worker._target(EASY_BITS)
+
+
+def _mine(prefix: bytes, hard: bool = False) -> bytes:
+    """Finish a 76-byte header prefix with a nonce that meets (or, if ``hard``, misses) the target."""
+    for nonce in range(1 << 16):
+        header = prefix + nonce.to_bytes(4, 'little')
+        meets = int.from_bytes(verify_worker._block_hash(header), 'little') <= EASY_LIMIT
+        if meets != hard:
+            return header
+    raise AssertionError('no nonce found')
+
+
+def _header(prev: bytes, root: bytes, bits: int = EASY_BITS, hard: bool = False) -> bytes:
+    return _mine((1).to_bytes(4, 'little') + prev + root + (1_231_006_505).to_bytes(4, 'little')
+                 + bits.to_bytes(4, 'little'), hard)
+
+
+def _chain(n: int) -> list[bytes]:
+    """``n`` linked, mined 80-byte headers with a distinct merkle root each."""
+    headers, prev = [], b'\0' * 32
+    for height in range(n):
+        header = _header(prev, hashlib.sha256(b'root %d' % height).digest())
+        headers.append(header)
+        prev = verify_worker._block_hash(header)
+    return headers
+
+
+def _open(path, headers) -> main.BlockHeaderStore:
+    """A store whose genesis is our fixture chain's first header."""
+    return main.BlockHeaderStore(str(path), genesis=verify_worker._block_hash(headers[0]), pow_limit=EASY_LIMIT)
+
+
+def _proof(digest: bytes, height: int) -> bytes:
+    stamp = Timestamp(digest)
+    stamp.attestations.add(BitcoinBlockHeaderAttestation(height))
+    buf = io.BytesIO()
+    DetachedTimestampFile(OpSHA256(), stamp).serialize(StreamSerializationContext(buf))
+    return buf.getvalue()
+
+
+@pytest.fixture
+def headers():
+    return _chain(5)
+
+
+@pytest.fixture
+def store(tmp_path, headers):
+    store = _open(tmp_path / 'headers.bin', headers)
+    store.append(b''.join(headers[:3]))
+    yield store
+    store.close()
+
+
+def test_lookup_by_height(store, headers):
+    assert len(store) == 3
+    assert store.merkle_root(2) == headers[2][36:68]
+    assert store.merkle_root(3) is None
+    assert store.merkle_root(-1) is None
+
+
+def test_append_must_extend_the_tip(store, headers):
+    with pytest.raises(ValueError):
+        store.append(headers[4])  # skips height 3
+    with pytest.raises(ValueError):
+        store.append(headers[3][:79])
+    assert store.append(b''.join(headers[3:])) == 5
+    assert store.merkle_root(4) == headers[4][36:68]
+
+
+def test_load_from_appends_only_the_new_tail(store, headers, tmp_path):
+    dump = tmp_path / 'dump.bin'
+    dump.write_bytes(b''.join(headers))
+    assert store.load_from(str(dump)) == 5
+    assert store.load_from(str(dump)) == 5
+
+
+def test_reopen_sees_what_was_written(store, headers):
+    reopened = _open(store.path, headers)
+    try:
+        assert len(reopened) == 3
+        assert reopened.merkle_root(1) == headers[1][36:68]
+    finally:
+        reopened.close()
+
+
+def test_verify_checks_the_merkle_root(store, headers):
+    assert main._ots_verify(_proof(headers[2][36:68], 2), store) is True
+    assert main._ots_verify(_proof(b'\1' * 32, 2), store) is False
+    # A block we haven't heard of yet doesn't verify...
+    assert main._ots_verify(_proof(headers[4][36:68], 4), store) is False
+    # ...until it arrives.
+    store.append(b''.join(headers[3:]))
+    assert main._ots_verify(_proof(headers[4][36:68], 4), store) is True
+
+
+def test_empty_store_is_still_a_store(tmp_path, headers):
+    empty = _open(tmp_path / 'empty.bin', headers)
+    try:
+        assert len(empty) == 0
+        assert main._ots_verify(_proof(headers[0][36:68], 0), empty) is False
+    finally:
+        empty.close()
+
+
+def test_headers_must_carry_their_proof_of_work(store, headers):
+    tip = verify_worker._block_hash(headers[2])
+    with pytest.raises(ValueError, match='proof of work'):
+        store.append(_header(tip, hashlib.sha256(b'forged').digest(), hard=True))
+    with pytest.raises(ValueError, match='difficulty'):
+        store.append(_header(tip, hashlib.sha256(b'forged').digest(), bits=EASY_BITS + 1))
+    assert len(store) == 3
+    assert store.append(headers[3]) == 4
+
+
+def test_first_header_must_be_genesis(tmp_path, headers):
+    forged = _header(b'\0' * 32, hashlib.sha256(b'forged').digest())
+    empty = _open(tmp_path / 'empty.bin', headers)
+    try:
+        with pytest.raises(ValueError, match='genesis'):
+            empty.append(forged)
+        assert len(empty) == 0
+    finally:
+        empty.close()
+    # A file that was poisoned before the check existed isn't trusted either.
+    (tmp_path / 'poisoned.bin').write_bytes(forged)
+    with pytest.raises(ValueError, match='genesis'):
+        _open(tmp_path / 'poisoned.bin', headers)
+
+
+def test_real_mainnet_headers_are_accepted(tmp_path):
+    genesis = bytes.fromhex(
+        '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e'
+        '67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c'
+    )
+    block_1 = bytes.fromhex(
+        '010000006fe28c0ab6f1b372c1a6a246ae63f74f931e8365e15a089c68d6190000000000982051fd1e4ba744bbbe680e'
+        '1fee14677ba1a3c3540bf7b1cdb606e857233e0e61bc6649ffff001d01e36299'
+    )
+    mainnet = main.BlockHeaderStore(str(tmp_path / 'mainnet.bin'))
+    try:
+        assert mainnet.append(genesis + block_1) == 2
+    finally:
+        mainnet.close()
+
+
+def test_retarget_matches_the_first_mainnet_adjustment():
+    # Blocks 30240..32255 took 1,022,578 s; block 32256 came out at 0x1d00d86a.
+    target = verify_worker._target(0x1D00FFFF) * 1_022_578 // verify_worker.RETARGET_TIMESPAN
+    assert verify_worker._compact(target) == 0x1D00D86A
+
+
+def test_posting_headers_needs_the_operator_token(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, 'BTC_HEADERS_TOKEN', None)
+    assert client.post('/btc/headers', content=b'\0' * 80).status_code == 403
+    monkeypatch.setattr(main, 'BTC_HEADERS_TOKEN', 's3cret')
+    assert client.post('/btc/headers', content=b'\0' * 80).status_code == 401
+    assert client.post('/btc/headers', content=b'\0' * 80,
+                       headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    # Past the door, but this server has no store to append to.
+    assert client.post('/btc/headers', content=b'\0' * 80,
+                       headers={'Authorization': 'Bearer s3cret'}).status_code == 503
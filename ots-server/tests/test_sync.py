@@ -0,0 +1,113 @@
+"""Delta sync against the real schema: legacy rows, resets, the archiver and
+conflicts. Each test registers its own user, so they share one database
+without stepping on each other."""
+import sqlite3
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+@pytest.fixture
+def user_id():
+    resp = client.post('/users/register', json={'username': uuid.uuid4().hex, 'password': 'hunter2'})
+    return resp.json()['id']
+
+
+def _sync(user_id, since=0, changes=()):
+    resp = client.post('/sync', json={'user_id': user_id, 'since': since, 'changes': list(changes)})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def _task(client_id, title, updated_at, completed=False):
+    return {
+        'client_id': client_id,
+        'data': {'id': client_id, 'title': title, 'completed': completed},
+        'updated_at': updated_at,
+    }
+
+
+def test_rows_from_before_sync_are_sent(user_id):
+    # What a todo looked like before the sync columns existed.
+    main.writer.submit(lambda cur: cur.execute(
+        "INSERT INTO todos (user_id, text, client_id, seq) VALUES (?, 'legacy', 'srv-legacy', 0)", (user_id,),
+    ))
+    main.writer.submit(main._backfill_sync)
+
+    result = _sync(user_id)
+    assert [c['text'] for c in result['changes']] == ['legacy']
+    assert result['changes'][0]['updated_at']
+    assert result['seq'] >= result['changes'][0]['seq'] > 0
+
+
+def test_since_ahead_of_the_server_resets(user_id):
+    client.post('/todos/add', json={'user_id': user_id, 'text': 'survivor'})
+    seq = _sync(user_id)['seq']
+
+    result = _sync(user_id, since=seq + 100)
+    assert result['reset'] is True
+    assert [c['text'] for c in result['changes']] == ['survivor']
+    assert _sync(user_id, since=seq) == {'seq': seq, 'reset': False, 'changes': []}
+
+
+def test_reset_after_archive(user_id):
+    _sync(user_id, changes=[
+        _task('old', 'done ages ago', 1_000, completed=True),
+        _task('gone', 'deleted ages ago', 1_000),
+        _task('fresh', 'still going', 1_000),
+    ])
+    seq = _sync(user_id, changes=[{'client_id': 'gone', 'deleted': True, 'updated_at': 2_000}])['seq']
+    main.writer.submit(lambda cur: cur.execute(
+        "UPDATE todos SET completed = datetime('now', '-400 days') WHERE user_id = ? AND client_id = 'old'",
+        (user_id,),
+    ))
+
+    conn = sqlite3.connect(main.DB_PATH)
+    try:
+        main._archive_done_todos(conn)
+    finally:
+        conn.close()
+
+    archived = main.db.execute('SELECT client_id FROM todos_archive WHERE user_id = ?', (user_id,)).fetchall()
+    assert archived == [('old',)]
+    hot = main.db.execute('SELECT client_id FROM todos WHERE user_id = ?', (user_id,)).fetchall()
+    assert hot == [('fresh',)]
+
+    result = _sync(user_id, since=seq - 1)
+    assert result['reset'] is True
+    assert [c['client_id'] for c in result['changes']] == ['fresh']
+
+    # The browser still has the archived task and pushes it again after the
+    # reset: it is matched in the archive, not inserted a second time.
+    _sync(user_id, since=0, changes=[_task('old', 'done ages ago', 1_000, completed=True)])
+    count = main.db.execute(
+        "SELECT (SELECT COUNT(*) FROM todos WHERE user_id = ?1 AND client_id = 'old') + "
+        "(SELECT COUNT(*) FROM todos_archive WHERE user_id = ?1 AND client_id = 'old')",
+        (user_id,),
+    ).fetchone()[0]
+    assert count == 1
+
+
+def test_latest_edit_wins_and_delete_breaks_ties(user_id):
+    base = _sync(user_id, changes=[_task('t', 'first', 1_000)])['seq']
+
+    # Another device edits at t=3000, then a stale offline edit from t=2000 arrives.
+    _sync(user_id, since=base, changes=[_task('t', 'newer', 3_000)])
+    result = _sync(user_id, since=base, changes=[_task('t', 'older', 2_000)])
+    assert [c['data']['title'] for c in result['changes']] == ['newer']
+
+    # A newer edit from the stale device does win.
+    seq = _sync(user_id, since=base, changes=[_task('t', 'newest', 4_000)])['seq']
+    assert main.db.execute(
+        "SELECT text FROM todos WHERE user_id = ? AND client_id = 't'", (user_id,),
+    ).fetchone() == ('newest',)
+
+    # An edit and a delete in the same millisecond: the delete wins, whichever lands first.
+    _sync(user_id, since=seq, changes=[{'client_id': 't', 'deleted': True, 'updated_at': 5_000}])
+    result = _sync(user_id, since=seq, changes=[_task('t', 'edited', 5_000)])
+    assert [c['deleted'] for c in result['changes']] == [True]
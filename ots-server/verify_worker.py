@@ -0,0 +1,218 @@
+"""Attestation checking that batch verification's worker processes can import.
+
+main.py opens the database and starts the group-commit writer as soon as it
+is imported, which a spawned pool worker must not do. Everything the workers
+need lives here instead: the block-header store, the check itself, and a pool
+initializer that gives each worker its own view of the header file.
+"""
+import hashlib
+import io
+import mmap
+import os
+import threading
+
+from opentimestamps.core.notary import BitcoinBlockHeaderAttestation
+from opentimestamps.core.serialize import StreamDeserializationContext
+from opentimestamps.core.timestamp import DetachedTimestampFile
+
+HEADER_SIZE = 80
+
+# Mainnet consensus parameters. The genesis hash is in internal byte order
+# (the way the next header stores it), i.e. reversed from how explorers show it.
+BITCOIN_GENESIS = bytes.fromhex('000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f')[::-1]
+BITCOIN_POW_LIMIT = 0xFFFF << 208
+RETARGET_INTERVAL = 2016
+RETARGET_TIMESPAN = 14 * 24 * 60 * 60
+
+
+def _block_hash(header: bytes) -> bytes:
+    """Double SHA-256 of a header, in the byte order the next header stores it."""
+    return hashlib.sha256(hashlib.sha256(header).digest()).digest()
+
+
+def _bits(header: bytes) -> int:
+    return int.from_bytes(header[72:76], 'little')
+
+
+def _time(header: bytes) -> int:
+    return int.from_bytes(header[68:72], 'little')
+
+
+def _target(bits: int) -> int:
+    """Expand a compact nBits into the target it encodes; 0 if it is negative."""
+    if bits & 0x00800000:
+        return 0
+    size, mantissa = bits >> 24, bits & 0x007FFFFF
+    return mantissa << 8 * (size - 3) if size >= 3 else mantissa >> 8 * (3 - size)
+
+
+def _compact(target: int) -> int:
+    """The nBits encoding of ``target``, as Bitcoin Core rounds it."""
+    size = (target.bit_length() + 7) // 8
+    mantissa = target << 8 * (3 - size) if size <= 3 else target >> 8 * (size - 3)
+    if mantissa & 0x00800000:
+        mantissa >>= 8
+        size += 1
+    return size << 24 | mantissa
+
+
+class BlockHeaderStore:
+    """Bitcoin block headers as a memory-mapped file of 80-byte records.
+
+    Record N is the header at height N. Nothing gets in without being checked
+    the way a node would check it: record 0 must be ``genesis``, every header
+    after it must link onto the tip (each carries its parent's hash at bytes
+    4..36), claim the difficulty the retarget rules call for, and carry the
+    work to back the claim. Forging a header therefore costs as much as
+    mining a block. A partial trailing record, left by a crash mid-write, is
+    ignored and overwritten by the next append.
+
+    Readers never take the lock. The mapping and its record count live in one
+    tuple that ``_remap`` replaces in a single assignment, and an outgrown map
+    is not closed: a reader may still be slicing it, and it is unmapped once
+    the last reference to it goes.
+    """
+
+    def __init__(self, path: str, genesis: bytes = BITCOIN_GENESIS, pow_limit: int = BITCOIN_POW_LIMIT):
+        self.path = path
+        self.genesis = genesis
+        self.pow_limit = pow_limit
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        self._view: tuple[mmap.mmap | None, int] = (None, 0)
+        self._remap()
+        mapped, count = self._view
+        if count and _block_hash(mapped[:HEADER_SIZE]) != genesis:
+            self._file.close()
+            raise ValueError(f'{path} does not start with the genesis block; refusing to trust it')
+
+    def _remap(self) -> None:
+        count = os.fstat(self._file.fileno()).st_size // HEADER_SIZE
+        mapped = mmap.mmap(self._file.fileno(), count * HEADER_SIZE, access=mmap.ACCESS_READ) if count else None
+        self._view = (mapped, count)
+
+    def __len__(self) -> int:
+        return self._view[1]
+
+    def header(self, height: int) -> bytes | None:
+        """The raw 80-byte header at ``height``, or None if we don't have it."""
+        if height < 0:
+            return None
+        mapped, count = self._view
+        if height >= count:
+            # Someone (another worker, an import) may have appended since we
+            # mapped the file. One fstat on a miss is cheap; hits pay nothing.
+            with self._lock:
+                if os.fstat(self._file.fileno()).st_size // HEADER_SIZE > self._view[1]:
+                    self._remap()
+            mapped, count = self._view
+            if height >= count:
+                return None
+        offset = height * HEADER_SIZE
+        return mapped[offset:offset + HEADER_SIZE]
+
+    def merkle_root(self, height: int) -> bytes | None:
+        """The merkle root at ``height`` in serialized byte order, as OTS attests it."""
+        header = self.header(height)
+        return header[36:68] if header is not None else None
+
+    def append(self, headers: bytes) -> int:
+        """Append consecutive raw headers onto the tip; returns the new header count."""
+        if len(headers) % HEADER_SIZE:
+            raise ValueError(f'header data must be a multiple of {HEADER_SIZE} bytes')
+        with self._lock:
+            mapped, count = self._view
+
+            def at(height: int) -> bytes:
+                if height < count:
+                    return mapped[height * HEADER_SIZE:(height + 1) * HEADER_SIZE]
+                offset = (height - count) * HEADER_SIZE
+                return headers[offset:offset + HEADER_SIZE]
+
+            for height in range(count, count + len(headers) // HEADER_SIZE):
+                self._check(height, at)
+            if headers:
+                self._file.truncate(count * HEADER_SIZE)
+                self._file.write(headers)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._remap()
+            return self._view[1]
+
+    def _check(self, height: int, at) -> None:
+        """Refuse the header at ``height`` unless a node would accept it; ``at`` reads any height."""
+        header = at(height)
+        block_hash = _block_hash(header)
+        if height == 0:
+            if block_hash != self.genesis:
+                raise ValueError('header 0 is not the genesis block')
+            return
+        prev = at(height - 1)
+        if header[4:36] != _block_hash(prev):
+            raise ValueError(f'header {height} does not extend the chain')
+        if height % RETARGET_INTERVAL:
+            expected = _bits(prev)
+        else:
+            first = at(height - RETARGET_INTERVAL)
+            timespan = min(max(_time(prev) - _time(first), RETARGET_TIMESPAN // 4), RETARGET_TIMESPAN * 4)
+            expected = _compact(min(_target(_bits(prev)) * timespan // RETARGET_TIMESPAN, self.pow_limit))
+        if _bits(header) != expected:
+            raise ValueError(f'header {height} claims the wrong difficulty')
+        target = _target(expected)
+        if not 0 < target <= self.pow_limit or int.from_bytes(block_hash, 'little') > target:
+            raise ValueError(f'header {height} lacks the proof of work it claims')
+
+    def load_from(self, path: str, chunk_headers: int = 10_000) -> int:
+        """Append whatever ``path`` (a genesis-first header dump) has beyond our tip."""
+        with open(path, 'rb') as src:
+            src.seek(len(self) * HEADER_SIZE)
+            while chunk := src.read(chunk_headers * HEADER_SIZE):
+                self.append(chunk[:len(chunk) - len(chunk) % HEADER_SIZE])
+                if len(chunk) % HEADER_SIZE:
+                    break
+        return len(self)
+
+    def close(self) -> None:
+        with self._lock:
+            mapped, _ = self._view
+            self._view = (None, 0)
+            if mapped is not None:
+                mapped.close()
+            self._file.close()
+
+
+def verify(proof_bytes: bytes, store: BlockHeaderStore | None) -> bool:
+    """Does any Bitcoin attestation in the proof check out against ``store``?
+
+    With a store, the digest the proof commits to must be the merkle root of
+    the block it names; a height the store doesn't have yet does not verify.
+    With None, the attestation merely has to exist.
+    """
+    dctx = StreamDeserializationContext(io.BytesIO(proof_bytes))
+    stamp = DetachedTimestampFile.deserialize(dctx)
+    for msg, att in stamp.timestamp.all_attestations():
+        if not isinstance(att, BitcoinBlockHeaderAttestation):
+            continue
+        if store is None or store.merkle_root(att.height) == msg:
+            return True
+    return False
+
+
+# ── Pool worker side ────────────────────────────────────────────────────────
+
+_store: BlockHeaderStore | None = None
+
+
+def init(headers_path: str | None) -> None:
+    """Pool initializer: open this worker's own header store, if there is one."""
+    global _store
+    if headers_path:
+        _store = BlockHeaderStore(headers_path)
+
+
+def verify_quiet(proof_bytes: bytes) -> bool | None:
+    """``verify`` against this worker's store; a malformed proof is None."""
+    try:
+        return verify(proof_bytes, _store)
+    except Exception:
+        return None
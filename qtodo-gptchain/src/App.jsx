@@ -4,7 +4,17 @@ import { canonicalizeTask, sha256Hex } from './utils/ots'
 import { aiPriorityScore, priorityClass, TAGS } from './utils/priority'
 import Failure from './Failure'
 import MatrixRain from './MatrixRain'
-import SettingsModal, { getOpenAIKey, getEvmCreds } from './components/SettingsModal'
+import SettingsModal, { getOpenAIKey, getEvmCreds, getSyncUserId } from './components/SettingsModal'
+import {
+  diffTasks,
+  loadSyncState,
+  mergeServerChanges,
+  nextSyncState,
+  recordDeletions,
+  saveSyncState,
+  stampEdits,
+  syncTasks,
+} from './utils/sync'
 import {
   createDefaultStats,
   recordEvent,
@@ -143,14 +153,43 @@ function App() {
   // reads the current value even if state hasn't flushed yet. React state and
   // synchronous DOM events have a complicated relationship we prefer not to discuss.
   const dragIndexRef = useRef(null)
+  // The sync effects fire on timers; this ref lets them see the current list
+  // without re-subscribing on every keystroke.
+  const tasksRef = useRef(tasks)
+  const syncingRef = useRef(false)
+  // Edits are stamped with when they happened by comparing against the
+  // previous list. Loads, other tabs and server merges bring their own stamps,
+  // so they set skipStampRef and are left alone.
+  const prevTasksRef = useRef(null)
+  const skipStampRef = useRef(false)
 
   // ── Persistence ──────────────────────────────────────────────────────────
 
   useEffect(() => {
     const saved = localStorage.getItem('tasks')
-    if (saved) setTasks(JSON.parse(saved))
+    if (saved) {
+      skipStampRef.current = true
+      setTasks(JSON.parse(saved))
+    }
   }, [])
 
+  useEffect(() => {
+    const prev = prevTasksRef.current
+    prevTasksRef.current = tasks
+    if (prev === null || skipStampRef.current) {
+      skipStampRef.current = false
+      return
+    }
+    const state = loadSyncState()
+    const deleted = recordDeletions(state.deleted, prev, tasks)
+    if (deleted !== state.deleted) saveSyncState({ ...state, deleted })
+    const stamped = stampEdits(prev, tasks)
+    if (stamped !== tasks) {
+      skipStampRef.current = true
+      setTasks(stamped)
+    }
+  }, [tasks])
+
   useEffect(() => {
     if (!isExternalUpdate.current) {
       localStorage.setItem('tasks', JSON.stringify(tasks))
@@ -163,6 +202,43 @@ function App() {
     localStorage.setItem('failureStats', JSON.stringify(stats))
   }, [stats])
 
+  // ── Backend delta sync (opt-in: set a sync user id in ⚙ Settings) ────────
+  //    Only what changed goes up, only what changed comes down. The server
+  //    settles conflicts; localStorage remains what we render from.
+
+  const runSync = useCallback(async (pullOnly) => {
+    const userId = getSyncUserId()
+    if (!userId || syncingRef.current) return
+    const state = loadSyncState()
+    if (!pullOnly && diffTasks(tasksRef.current, state.shadow, Date.now(), state.deleted).length === 0) return
+    syncingRef.current = true
+    try {
+      const { response, sent } = await syncTasks({ tasks: tasksRef.current, state, userId })
+      // Deletions made while the request was out were saved meanwhile; keep them.
+      saveSyncState(nextSyncState({ ...state, deleted: loadSyncState().deleted }, response, sent))
+      if (response.changes.length > 0) {
+        skipStampRef.current = true
+        setTasks((prev) => mergeServerChanges(prev, response.changes))
+      }
+    } catch (err) {
+      console.warn('Sync failed. localStorage remains the single source of truth (and of regret).', err)
+    } finally {
+      syncingRef.current = false
+    }
+  }, [])
+
+  useEffect(() => {
+    tasksRef.current = tasks
+    const id = setTimeout(() => runSync(false), 2_000)
+    return () => clearTimeout(id)
+  }, [tasks, runSync])
+
+  useEffect(() => {
+    runSync(true)
+    const id = setInterval(() => runSync(true), 30_000)
+    return () => clearInterval(id)
+  }, [runSync])
+
   // ── Multi-tab sync ───────────────────────────────────────────────────────
 
   useEffect(() => {
@@ -173,6 +249,7 @@ function App() {
         // Another tab updated tasks. We accept the update without question,
         // because distributed consensus is hard and we have a deadline.
         isExternalUpdate.current = true
+        skipStampRef.current = true
         setTasks(e.data.tasks)
       }
     }
@@ -300,7 +377,8 @@ function App() {
       const res = await fetch('http://localhost:8000/ots/create', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ hash: task.otsMeta.hash }),
+        // With a sync user id set, the proof lands in that user's /ots/export.
+        body: JSON.stringify({ hash: task.otsMeta.hash, user_id: getSyncUserId() }),
       })
       if (!res.ok) throw new Error(`HTTP ${res.status}`)
       const data = await res.json()
@@ -11,6 +11,7 @@ export const STORAGE_KEYS = {
   EVM_CHAIN: 'qtodo_evm_chain',
   EVM_EXPLORER: 'qtodo_evm_explorer',
   EVM_MODE: 'qtodo_evm_mode',
+  SYNC_USER_ID: 'qtodo_sync_user_id',
 }
 
 export function getOpenAIKey() {
@@ -28,6 +29,12 @@ export function getEvmCreds() {
   }
 }
 
+// Backend user whose todos this browser syncs with; null means sync is off.
+export function getSyncUserId() {
+  const value = Number(localStorage.getItem(STORAGE_KEYS.SYNC_USER_ID))
+  return Number.isInteger(value) && value > 0 ? value : null
+}
+
 function Field({ label, type = 'text', value, onChange, placeholder, hint }) {
   return (
     <div className="mb-3">
@@ -54,6 +61,7 @@ export default function SettingsModal({ onClose }) {
   const [chain, setChain] = useState(() => localStorage.getItem(STORAGE_KEYS.EVM_CHAIN) || 'base-sepolia')
   const [explorer, setExplorer] = useState(() => localStorage.getItem(STORAGE_KEYS.EVM_EXPLORER) || 'https://sepolia.basescan.org')
   const [mode, setMode] = useState(() => localStorage.getItem(STORAGE_KEYS.EVM_MODE) || 'lite')
+  const [syncUserId, setSyncUserId] = useState(() => localStorage.getItem(STORAGE_KEYS.SYNC_USER_ID) || '')
 
   const [deployStatus, setDeployStatus] = useState('')
   const [saved, setSaved] = useState(false)
@@ -75,6 +83,9 @@ export default function SettingsModal({ onClose }) {
     localStorage.setItem(STORAGE_KEYS.EVM_EXPLORER, explorer)
     localStorage.setItem(STORAGE_KEYS.EVM_MODE, mode)
 
+    if (syncUserId) localStorage.setItem(STORAGE_KEYS.SYNC_USER_ID, syncUserId)
+    else localStorage.removeItem(STORAGE_KEYS.SYNC_USER_ID)
+
     setSaved(true)
     setTimeout(() => setSaved(false), 2000)
   }
@@ -199,6 +210,25 @@ export default function SettingsModal({ onClose }) {
           </div>
         </section>
 
+        {/* ── Backend sync ────────────────────────────────────────────────── */}
+        <section className="mb-5">
+          <h3 className="text-xs text-green-700 border-b border-green-900 pb-1 mb-3">
+            Backend Sync — Eventual Consistency, Now Slightly Less Eventual
+          </h3>
+          <p className="text-xs text-gray-600 mb-3">
+            Set a backend user id to keep this browser's tasks in step with the
+            server (and therefore with any AI agent meddling via MCP). Only
+            changes travel. Leave blank to keep your tasks to yourself.
+          </p>
+          <Field
+            label="Sync User ID"
+            value={syncUserId}
+            onChange={setSyncUserId}
+            placeholder="e.g. 1"
+            hint="The user_id returned by /users/register or /users/login"
+          />
+        </section>
+
         {/* ── Contract deployment ──────────────────────────────────────────── */}
         <section className="mb-5">
           <h3 className="text-xs text-green-700 border-b border-green-900 pb-1 mb-3">
@@ -0,0 +1,137 @@
+import { describe, it, expect, vi } from 'vitest'
+import {
+  createSyncState,
+  diffTasks,
+  hashTask,
+  mergeServerChanges,
+  nextSyncState,
+  recordDeletions,
+  stampEdits,
+  syncTasks,
+  taskSyncId,
+} from './utils/sync'
+
+const task = (overrides = {}) => ({ title: 'sync me', note: '', created_at: 1, completed: false, ...overrides })
+
+// Delta sync: proving that we can send less data about tasks nobody will do.
+describe('sync utils', () => {
+  // created_at has been an id in disguise all along; server tasks bring their own.
+  it('derives sync ids', () => {
+    expect(taskSyncId(task())).toBe('ca-1')
+    expect(taskSyncId(task({ sync_id: 'srv-7' }))).toBe('srv-7')
+  })
+
+  // An empty shadow means everything is news to the server.
+  it('sends every task on first sync', () => {
+    const changes = diffTasks([task({ updated_at: 50 }), task({ created_at: 2 })], {}, 100)
+    expect(changes).toHaveLength(2)
+    expect(changes[0]).toEqual({ client_id: 'ca-1', data: task({ updated_at: 50 }), deleted: false, updated_at: 50 })
+    // Never stamped: as old as the task itself, not as new as the sync.
+    expect(changes[1].updated_at).toBe(2)
+  })
+
+  // Unchanged tasks stay home; edited and vanished ones go out.
+  it('sends only edits and deletions after that', () => {
+    const shadow = { 'ca-1': hashTask(task()), 'ca-2': hashTask(task({ created_at: 2 })) }
+    const edited = task({ completed: true, updated_at: 60 })
+    const changes = diffTasks([edited], shadow, 100, { 'ca-2': 70 })
+    expect(changes).toEqual([
+      { client_id: 'ca-1', data: edited, deleted: false, updated_at: 60 },
+      { client_id: 'ca-2', data: null, deleted: true, updated_at: 70 },
+    ])
+  })
+
+  // Edits get the time they happened; reordering and restamping are not edits.
+  it('stamps edits when they happen', () => {
+    const prev = [task(), task({ created_at: 2 })]
+    expect(stampEdits(prev, [...prev].reverse(), 100)).toEqual([...prev].reverse())
+    const next = stampEdits(prev, [task({ title: 'edited' }), prev[1], task({ created_at: 3 })], 100)
+    expect(next.map((t) => t.updated_at)).toEqual([100, undefined, 100])
+    expect(stampEdits(next, next, 200)).toBe(next)
+  })
+
+  // Deleted tasks leave no task to stamp, so their time is kept separately.
+  it('records when tasks were deleted', () => {
+    const prev = [task(), task({ created_at: 2 })]
+    const deleted = recordDeletions({}, prev, [prev[0]], 100)
+    expect(deleted).toEqual({ 'ca-2': 100 })
+    expect(recordDeletions(deleted, [prev[0]], [prev[0]], 200)).toBe(deleted)
+  })
+
+  // Offline for hours, then online: the old edit goes out with its old time,
+  // loses to the agent's newer edit on the server, and the server copy lands here.
+  it('lets a newer server edit beat a stale offline edit', () => {
+    const synced = task()
+    const offline = stampEdits([synced], [task({ title: 'offline edit' })], 1_000)
+    const state = { seq: 4, shadow: { 'ca-1': hashTask(synced) }, deleted: {} }
+    const sent = diffTasks(offline, state.shadow, 9_000)
+    expect(sent[0].updated_at).toBe(1_000)
+    const serverEdit = { client_id: 'ca-1', deleted: false, updated_at: 5_000, data: task({ title: 'agent edit' }) }
+    expect(serverEdit.updated_at).toBeGreaterThan(sent[0].updated_at)
+    const response = { seq: 6, reset: false, changes: [serverEdit] }
+    const merged = mergeServerChanges(offline, response.changes)
+    expect(merged[0].title).toBe('agent edit')
+    expect(merged[0].updated_at).toBe(5_000)
+    expect(diffTasks(merged, nextSyncState(state, response, sent).shadow)).toEqual([])
+  })
+
+  // The server's version replaces ours in place, new tasks go to the end, deletions vanish.
+  it('merges server changes', () => {
+    const local = [task(), task({ created_at: 2 })]
+    const merged = mergeServerChanges(local, [
+      { client_id: 'ca-2', deleted: true },
+      { client_id: 'ca-1', deleted: false, data: task({ title: 'server wins' }) },
+      { client_id: 'srv-9', deleted: false, data: null, text: 'from an agent', done: false, created: '2024-01-01 00:00:00' },
+    ])
+    expect(merged.map((t) => t.title)).toEqual(['server wins', 'from an agent'])
+    expect(merged[1].sync_id).toBe('srv-9')
+    expect(merged[1].created_at).toBe(Date.parse('2024-01-01T00:00:00Z'))
+  })
+
+  // After a round trip, nothing should look changed — otherwise we'd sync forever.
+  it('leaves nothing to send after a round trip', () => {
+    const local = [task(), task({ created_at: 2 })]
+    const sent = diffTasks(local, {}, 100)
+    const response = {
+      seq: 3,
+      reset: false,
+      changes: [{ client_id: 'srv-9', deleted: false, data: null, text: 'agent task', done: false, created: null }],
+    }
+    const state = nextSyncState(createSyncState(), response, sent)
+    const merged = mergeServerChanges(local, response.changes)
+    expect(state.seq).toBe(3)
+    expect(diffTasks(merged, state.shadow)).toEqual([])
+  })
+
+  // A reset forgets the shadow, so local tasks get pushed again next time.
+  it('starts the shadow over on reset', () => {
+    const state = nextSyncState(
+      { seq: 5, shadow: { 'ca-1': 'abc' }, deleted: { 'ca-2': 1 } },
+      { seq: 9, reset: true, changes: [] },
+    )
+    expect(state).toEqual({ seq: 9, shadow: {}, deleted: {} })
+  })
+
+  // The wire format: since, user_id and the diff, nothing more.
+  it('posts the diff to /sync', async () => {
+    const fetchImpl = vi.fn().mockResolvedValue({
+      ok: true,
+      json: () => Promise.resolve({ seq: 1, reset: false, changes: [] }),
+    })
+    const { response, sent } = await syncTasks({
+      tasks: [task()],
+      state: createSyncState(),
+      userId: 4,
+      backend: 'http://backend',
+      fetchImpl,
+    })
+    expect(response.seq).toBe(1)
+    expect(sent).toHaveLength(1)
+    const [url, init] = fetchImpl.mock.calls[0]
+    expect(url).toBe('http://backend/sync')
+    const body = JSON.parse(init.body)
+    expect(body.user_id).toBe(4)
+    expect(body.since).toBe(0)
+    expect(body.changes[0].client_id).toBe('ca-1')
+  })
+})
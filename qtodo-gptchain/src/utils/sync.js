@@ -0,0 +1,169 @@
+// Delta sync with the backend's /sync endpoint. localStorage stays the source
+// the UI renders from; the server just hears about what changed and tells us
+// what changed on its side (MCP agents, other devices) since we last asked.
+//
+// Sync state lives in localStorage next to the tasks:
+//   { seq: <server seq we've seen>, shadow: { [syncId]: <hash of last synced version> },
+//     deleted: { [syncId]: <ms when deleted, until the server has heard> } }
+// Comparing tasks against the shadow tells us what to send without keeping
+// a second full copy of the list around.
+//
+// Conflicts are settled by when a task was edited, not when it was synced,
+// so every edit stamps the task's updated_at (see stampEdits) and deletions
+// are remembered with their time until they go out.
+
+export const SYNC_STATE_KEY = 'qtodo_sync_state'
+
+export function createSyncState() {
+  return { seq: 0, shadow: {}, deleted: {} }
+}
+
+export function loadSyncState() {
+  const saved = localStorage.getItem(SYNC_STATE_KEY)
+  return saved ? { ...createSyncState(), ...JSON.parse(saved) } : createSyncState()
+}
+
+export function saveSyncState(state) {
+  localStorage.setItem(SYNC_STATE_KEY, JSON.stringify(state))
+}
+
+// Tasks never had ids; created_at has been doing the job informally, so it
+// keeps doing it. Tasks born on the server arrive with a sync_id instead.
+export function taskSyncId(task) {
+  return task.sync_id ?? `ca-${task.created_at}`
+}
+
+// FNV-1a over the JSON. Not cryptographic, not trying to be — it only has to
+// notice that a task changed since the last sync.
+export function hashTask(task) {
+  const str = JSON.stringify(task)
+  let h = 0x811c9dc5
+  for (let i = 0; i < str.length; i++) {
+    h ^= str.charCodeAt(i)
+    h = Math.imul(h, 0x01000193)
+  }
+  return (h >>> 0).toString(16)
+}
+
+// The edit stamp is bookkeeping, not content: restamping an unchanged task
+// must not count as an edit.
+function contentHash(task) {
+  const { updated_at: _updatedAt, ...content } = task
+  return hashTask(content)
+}
+
+// Stamp every task whose content differs from its previous version (or is
+// new) with the time of the edit. Reordering isn't an edit. Returns `next`
+// itself when nothing changed, so callers can skip a re-render.
+export function stampEdits(prev, next, now = Date.now()) {
+  const before = new Map(prev.map((t) => [taskSyncId(t), contentHash(t)]))
+  let changed = false
+  const stamped = next.map((task) => {
+    if (before.get(taskSyncId(task)) === contentHash(task)) return task
+    changed = true
+    return { ...task, updated_at: now }
+  })
+  return changed ? stamped : next
+}
+
+// Sync ids that were in `prev` and are gone from `next`, with the time they went.
+export function recordDeletions(deleted, prev, next, now = Date.now()) {
+  const remaining = new Set(next.map(taskSyncId))
+  const gone = prev.map(taskSyncId).filter((id) => !remaining.has(id))
+  if (gone.length === 0) return deleted
+  return { ...deleted, ...Object.fromEntries(gone.map((id) => [id, now])) }
+}
+
+// Everything that differs from the shadow: new or edited tasks, plus
+// deletions for ids the shadow remembers but the list no longer has.
+// Each carries the time of the edit; `now` only stands in for tasks from
+// before edits were stamped, which lose to anything newer than their creation.
+export function diffTasks(tasks, shadow, now = Date.now(), deleted = {}) {
+  const changes = []
+  const seen = new Set()
+  for (const task of tasks) {
+    const id = taskSyncId(task)
+    seen.add(id)
+    if (shadow[id] !== hashTask(task)) {
+      changes.push({ client_id: id, data: task, deleted: false, updated_at: task.updated_at ?? task.created_at ?? now })
+    }
+  }
+  for (const id of Object.keys(shadow)) {
+    if (!seen.has(id)) changes.push({ client_id: id, data: null, deleted: true, updated_at: deleted[id] ?? now })
+  }
+  return changes
+}
+
+// Tasks created through the API arrive with text only. Dress them up as
+// frontend tasks so the UI doesn't trip over missing fields.
+function taskFromServer(change) {
+  const updatedAt = change.updated_at ?? change.data?.updated_at
+  if (change.data) return { ...change.data, sync_id: change.client_id, updated_at: updatedAt }
+  return {
+    sync_id: change.client_id,
+    updated_at: updatedAt,
+    title: change.text,
+    note: '',
+    tag: '🔥',
+    created_at: Date.parse(`${change.created?.replace(' ', 'T')}Z`) || Date.now(),
+    expired_at: null,
+    completed: change.done,
+    status: 'active',
+    user_id: 1,
+    version: 1,
+    otsMeta: {},
+  }
+}
+
+// The sync state after a round trip: what we sent is now what the server
+// has, and so is everything it sent back. A reset starts the shadow over.
+export function nextSyncState(state, response, sent = []) {
+  const shadow = response.reset ? {} : { ...state.shadow }
+  const deleted = { ...state.deleted }
+  for (const change of sent) {
+    if (change.deleted) {
+      delete shadow[change.client_id]
+      delete deleted[change.client_id]
+    } else {
+      shadow[change.client_id] = hashTask(change.data)
+    }
+  }
+  for (const change of response.changes) {
+    if (change.deleted) delete shadow[change.client_id]
+    else shadow[change.client_id] = hashTask(taskFromServer(change))
+  }
+  // Deletions the shadow has forgotten will never be sent; don't hoard them.
+  for (const id of Object.keys(deleted)) {
+    if (!(id in shadow)) delete deleted[id]
+  }
+  return { seq: response.seq, shadow, deleted }
+}
+
+// Fold the server's changes into the local list, keeping local order.
+export function mergeServerChanges(tasks, changes) {
+  const next = [...tasks]
+  for (const change of changes) {
+    const index = next.findIndex((t) => taskSyncId(t) === change.client_id)
+    if (change.deleted) {
+      if (index !== -1) next.splice(index, 1)
+    } else if (index === -1) {
+      next.push(taskFromServer(change))
+    } else {
+      next[index] = taskFromServer(change)
+    }
+  }
+  return next
+}
+
+// One round trip: send local changes, receive the server's. Returns the
+// server response plus what we sent, for nextSyncState/mergeServerChanges.
+export async function syncTasks({ tasks, state, userId, backend = 'http://localhost:8000', fetchImpl = fetch }) {
+  const sent = diffTasks(tasks, state.shadow, Date.now(), state.deleted)
+  const res = await fetchImpl(`${backend}/sync`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ user_id: userId, since: state.seq, changes: sent }),
+  })
+  if (!res.ok) throw new Error(`HTTP ${res.status}`)
+  return { response: await res.json(), sent }
+}
@@ -362,6 +362,7 @@ resource "aws_ecs_task_definition" "backend" {
       { name = "EVM_CHAIN",            value = var.evm_chain },
       { name = "EVM_EXPLORER",         value = var.evm_explorer },
       { name = "EVM_MODE",             value = var.evm_mode },
+      { name = "TRUSTED_PROXY_HOPS",   value = "1" },
     ]
     secrets = [{
       name      = "EVM_PRIVATE_KEY"